@@ -0,0 +1,85 @@
+import asyncio
+import contextlib
+import time
+import weakref
+
+import asyncpg
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from prices_comparator.middleware import record_sql
+
+
+# a pool is bound to the event loop it's made in, so every loop has its own
+_pools = weakref.WeakKeyDictionary()
+
+
+def _get_connect_params(alias=DEFAULT_DB_ALIAS):
+    ''' the database of the django connection, the test one in the tests '''
+
+    settings_dict = connections[alias].settings_dict
+    return {
+        'database': settings_dict['NAME'],
+        'user': settings_dict['USER'] or None,
+        'password': settings_dict['PASSWORD'] or None,
+        'host': settings_dict['HOST'] or None,
+        'port': settings_dict['PORT'] or None,
+    }
+
+
+async def _create_pool():
+    return await asyncpg.create_pool(
+        min_size=0, max_size=settings.ASYNC_DB_POOL_MAX_SIZE, **_get_connect_params()
+    )
+
+
+@contextlib.asynccontextmanager
+async def acquire():
+    ''' a connection of the pool of the running loop, without the pool
+    (ASYNC_DB_POOL_MAX_SIZE=0) a new one closed afterwards '''
+
+    if not settings.ASYNC_DB_POOL_MAX_SIZE:
+        connection = await asyncpg.connect(**_get_connect_params())
+        try:
+            yield connection
+        finally:
+            await connection.close()
+        return
+
+    loop = asyncio.get_running_loop()
+    # the first requests of the loop wait for the same pool
+    pool_task = _pools.get(loop, None)
+    if pool_task is None:
+        pool_task = _pools[loop] = loop.create_task(_create_pool())
+
+    try:
+        pool = await pool_task
+    except BaseException:
+        # the next request tries again
+        _pools.pop(loop, None)
+        raise
+
+    async with pool.acquire() as connection:
+        yield connection
+
+
+async def close_pool():
+    ''' the pool of the running loop, before the loop is closed '''
+
+    pool_task = _pools.pop(asyncio.get_running_loop(), None)
+    if pool_task is not None:
+        await (await pool_task).close()
+
+
+async def fetch(connection, sql, *args):
+    started = time.perf_counter()
+    rows = await connection.fetch(sql, *args)
+    record_sql(time.perf_counter() - started, len(rows))
+    return rows
+
+
+async def fetchrow(connection, sql, *args):
+    started = time.perf_counter()
+    row = await connection.fetchrow(sql, *args)
+    record_sql(time.perf_counter() - started, int(row is not None))
+    return row
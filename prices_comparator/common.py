@@ -1,3 +1,4 @@
+import datetime
 import enum
 
 
@@ -7,4 +8,40 @@ class ItemType(enum.Enum):
 
 
 IMPORT_UNIT_NAME_MAX_LENGTH = 200
-IMPORT_UNIT_TYPE_CHOICES=((ItemType.OFFER.value, ItemType.OFFER.value), (ItemType.CATEGORY.value, ItemType.CATEGORY.value))
\ No newline at end of file
+IMPORT_UNIT_TYPE_CHOICES=((ItemType.OFFER.value, ItemType.OFFER.value), (ItemType.CATEGORY.value, ItemType.CATEGORY.value))
+IMPORT_READ_CHUNK_SIZE = 64 * 1024
+# chars of an item or another value of an import buffered till it's parsed
+IMPORT_MAX_VALUE_LENGTH = 1024 * 1024
+
+# children of a category in a page of GET /nodes
+NODES_PAGE_MAX_LIMIT = 1000
+
+# nodes in a request of GET /nodes?ids=
+NODES_BATCH_MAX_IDS = 100
+
+# GET /sales lists offers updated in this period up to the date
+SALES_PERIOD = datetime.timedelta(hours=24)
+
+# subtree aggregates of every node calculated from scratch
+CALC_AGGREGATES_SQL = '''WITH RECURSIVE offer_ancestor(node_id, price) AS (
+        SELECT id, price FROM prices_comparator_importmodel
+        WHERE "type" = 'OFFER'
+    UNION ALL
+        SELECT n.parent_id_id, oa.price
+        FROM offer_ancestor AS oa
+        JOIN prices_comparator_importmodel AS n ON n.id = oa.node_id
+        WHERE n.parent_id_id IS NOT NULL)
+    SELECT node_id, COUNT(*) AS offers_count, COALESCE(SUM(price), 0) AS price_sum
+    FROM offer_ancestor GROUP BY node_id
+'''
+
+# materialized paths of every node calculated from scratch
+CALC_PATHS_SQL = '''WITH RECURSIVE node(id, path) AS (
+        SELECT id, '/' || id || '/' FROM prices_comparator_importmodel
+        WHERE parent_id_id IS NULL
+    UNION ALL
+        SELECT ch.id, n.path || ch.id || '/'
+        FROM prices_comparator_importmodel AS ch, node AS n
+        WHERE ch.parent_id_id = n.id)
+    SELECT id AS node_id, path FROM node
+'''
@@ -0,0 +1,44 @@
+import json
+import os
+
+import requests as http
+
+
+class HttpMixin:
+    ''' requests to a running service, _http can be replaced by a requests.Session '''
+
+    _http = http
+
+    def _send_imports_post(self, data):
+        return self._http.post(url=self._imports_url, 
+                               data=json.dumps(data))
+
+    def _send_nodes_get(self, id):
+        return self._http.get(url=f'{self._get_nodes_url()}{id}')
+
+    def _send_nodes_delete(self, id):
+        return self._http.delete(url=f'{self._get_nodes_url()}{id}')
+
+    def _send_delete(self, id):
+        return self._http.delete(url=f'{self._get_delete_url()}{id}')
+
+    @classmethod
+    def _get_host(self):
+        host = os.environ.get('WEB_HOST', 'http://127.0.0.1')
+        port = os.environ.get('WEB_PORT', '80')
+        return f'{host}:{port}'
+
+    @classmethod
+    def _get_imports_url(cls):
+        host = cls._get_host()
+        return f'{host}/imports'
+
+    @classmethod
+    def _get_nodes_url(cls):
+        host = cls._get_host()
+        return f'{host}/nodes/'
+
+    @classmethod
+    def _get_delete_url(cls):
+        host = cls._get_host()
+        return f'{host}/delete/'
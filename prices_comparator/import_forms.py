@@ -1,10 +1,24 @@
+import re
+import uuid
+
 import django.forms as forms
 from django.core.exceptions import ValidationError
+from django.core.validators import EMPTY_VALUES
 
 import prices_comparator.common as const
 from prices_comparator.common import ItemType
 
 
+def _with_canonical_ids(item, item_id, parent_id):
+    ''' UUIDField takes the ids in other forms as well (upper case, braces, no hyphens),
+    the paths and the lookups of the stored nodes need the canonical ones '''
+
+    item = dict(item, id=item_id)
+    if parent_id:
+        item['parentId'] = str(parent_id)
+    return item
+
+
 class ImportItemForm(forms.Form):
     id = forms.UUIDField()
     name = forms.CharField(max_length=const.IMPORT_UNIT_NAME_MAX_LENGTH)
@@ -56,7 +70,9 @@ class ListField(forms.MultipleChoiceField):
                 if new_id in self.local_ids.keys():
                     raise ValidationError('id is not unique in the imported set')
                 else:
-                    self.local_ids[new_id] = val
+                    self.local_ids[new_id] = _with_canonical_ids(
+                        val, new_id, form.cleaned_data['parentId']
+                    )
 
         self.all_ids = set(self.local_ids)
         for item in self.local_ids.values():
@@ -78,3 +94,146 @@ class ImportForm(forms.Form):
 
 class NodeForm(forms.Form):
     id = forms.UUIDField()
+
+
+class NodesBatchForm(forms.Form):
+    ''' ids separated by commas, the repeated ones are dropped '''
+
+    ids = forms.CharField()
+
+    def clean_ids(self):
+        ids = self.cleaned_data['ids'].split(',')
+        if len(ids) > const.NODES_BATCH_MAX_IDS:
+            raise ValidationError(message=f'More than {const.NODES_BATCH_MAX_IDS} ids')
+
+        try:
+            return list(dict.fromkeys(str(uuid.UUID(i.strip())) for i in ids))
+        except ValueError:
+            raise ValidationError(message='Invalid id')
+
+
+class NodePageForm(forms.Form):
+    ''' depth levels below the node, up to limit children of every category,
+    the node children start after the child with id after '''
+
+    depth = forms.IntegerField(min_value=0, required=False)
+    limit = forms.IntegerField(min_value=1, max_value=const.NODES_PAGE_MAX_LIMIT, required=False)
+    after = forms.UUIDField(required=False)
+
+
+class NodeStatisticForm(forms.Form):
+    ''' updates of the node in [dateStart, dateEnd), the bounds are optional '''
+
+    dateStart = forms.DateTimeField(required=False)
+    dateEnd = forms.DateTimeField(required=False)
+
+    def clean(self):
+        date_start = self.cleaned_data.get('dateStart', None)
+        date_end = self.cleaned_data.get('dateEnd', None)
+        if date_start and date_end and date_start >= date_end:
+            raise ValidationError(message='dateStart isn\'t before dateEnd')
+
+        return super().clean()
+
+
+class SalesForm(forms.Form):
+    date = forms.DateTimeField()
+
+
+class ImportValidator:
+    ''' checks an import payload by the rules of ImportForm in one pass without
+    creating a form for every item, items are added one by one as they're parsed '''
+
+    _re_decimal = re.compile(r'\.0*\s*$')
+    _item_types = frozenset(t.value for t in ItemType)
+
+    def __init__(self):
+        self.local_ids = {}
+        self.all_ids = set()
+        self._update_date_field = forms.DateTimeField()
+
+    def add_item(self, item):
+        if not isinstance(item, dict):
+            raise ValidationError(message=f'There is an error at \'{item}\'')
+
+        item_id = self._to_uuid(item.get('id', None))
+        parent_id = item.get('parentId', None)
+        if parent_id is not None and not isinstance(parent_id, str):
+            raise ValidationError('parentId is not a string')
+        parent_id = self._to_uuid(parent_id)
+        if item_id is None or not self._is_valid_name(item.get('name', None)):
+            raise ValidationError(message=f'There is an error at \'{item}\'')
+
+        item_type = item.get('type', None)
+        item_type = '' if item_type in EMPTY_VALUES else str(item_type)
+        if item_type not in self._item_types:
+            raise ValidationError(message=f'There is an error at \'{item}\'')
+
+        price = self._to_price(item.get('price', None))
+        if item_type == ItemType.CATEGORY.value and price is not None:
+            raise ValidationError(message='price for category isn\'t null')
+        elif item_type == ItemType.OFFER.value and price is None:
+            raise ValidationError(message='invalid offer price')
+
+        new_id = str(item_id)
+        if new_id in self.local_ids:
+            raise ValidationError('id is not unique in the imported set')
+        self.local_ids[new_id] = _with_canonical_ids(item, new_id, parent_id)
+
+    def validate(self, data):
+        ''' data are the payload fields except the added items, returns the update date '''
+
+        if data.get('items', None) or not self.local_ids:
+            raise ValidationError('items field is not a non-empty sequence')
+
+        self.all_ids = set(self.local_ids)
+        for item in self.local_ids.values():
+            parent_id = item.get('parentId', None)
+            if parent_id in EMPTY_VALUES:
+                continue
+
+            parent = self.local_ids.get(parent_id, None)
+            if parent and parent['type'] != ItemType.CATEGORY.value:
+                raise ValidationError(f'Only {ItemType.CATEGORY.value} can be a parent')
+            self.all_ids.add(parent_id)
+
+        update_date = data.get('updateDate', None)
+        if not isinstance(update_date, str) and update_date not in EMPTY_VALUES:
+            raise ValidationError('invalid update date')
+        return self._update_date_field.clean(update_date)
+
+    @staticmethod
+    def _to_uuid(value):
+        if value in EMPTY_VALUES:
+            return None
+
+        value = str(value).strip()
+        if not value:
+            return None
+
+        try:
+            return uuid.UUID(value)
+        except ValueError:
+            raise ValidationError('invalid uuid')
+
+    @staticmethod
+    def _is_valid_name(value):
+        if value in EMPTY_VALUES:
+            return False
+
+        value = str(value).strip()
+        return 0 < len(value) <= const.IMPORT_UNIT_NAME_MAX_LENGTH and '\x00' not in value
+
+    @classmethod
+    def _to_price(cls, value):
+        if value in EMPTY_VALUES:
+            return None
+
+        try:
+            value = int(cls._re_decimal.sub('', str(value)))
+        except (ValueError, TypeError):
+            raise ValidationError('invalid price')
+
+        if value < 0:
+            raise ValidationError('invalid price')
+        return value
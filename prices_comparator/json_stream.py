@@ -0,0 +1,156 @@
+import codecs
+import json
+import re
+from json.decoder import JSONDecodeError
+
+import prices_comparator.common as const
+
+
+_WHITESPACE = ' \t\n\r'
+_SCALAR_END = re.compile(r'[ \t\n\r,\]}]')
+
+
+class _ChunkReader:
+    ''' decodes a binary stream chunk by chunk and keeps only the unparsed tail of it '''
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, stream, chunk_size, max_size):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._max_size = max_size
+        self._size = 0
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._eof = False
+        self.buf = ''
+        self.pos = 0
+
+    def _read_chunk(self):
+        if self._eof:
+            return False
+
+        chunk = self._stream.read(self._chunk_size)
+        self._size += len(chunk)
+        if self._max_size is not None and self._size > self._max_size:
+            raise JSONDecodeError('Body is too large', self.buf, self.pos)
+
+        self._eof = not chunk
+        self.buf = self.buf[self.pos:] + self._text_decoder.decode(chunk, final=self._eof)
+        self.pos = 0
+        return True
+
+    def _read_more(self):
+        ''' at least doubles the unparsed tail, so a value is parsed again
+        a logarithmic number of times while its end is awaited, the tail is
+        limited by about twice IMPORT_MAX_VALUE_LENGTH '''
+
+        tail_length = len(self.buf) - self.pos
+        if tail_length > const.IMPORT_MAX_VALUE_LENGTH:
+            raise JSONDecodeError('Value is too long', self.buf, self.pos)
+
+        read = False
+        while len(self.buf) - self.pos < 2 * tail_length + self._chunk_size:
+            if not self._read_chunk():
+                break
+            read = True
+        return read
+
+    def peek(self):
+        ''' skips whitespaces and returns the next char, empty string at the end '''
+
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read_chunk():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise JSONDecodeError(f'Expecting one of \'{chars}\'', self.buf, self.pos)
+        self.pos += 1
+        return char
+
+    def _is_cut(self, ex):
+        ''' the error may be caused by the end of the buffer only if the string
+        isn't closed or no token ends between the error and the end '''
+
+        return (
+            ex.msg.startswith('Unterminated string')
+            or not _SCALAR_END.search(self.buf, ex.pos)
+        )
+
+    def value(self):
+        char = self.peek()
+
+        # a number or a literal is parsed only when its end is read,
+        # otherwise a prefix of it can be taken for the whole value
+        if char and char not in '{["':
+            while not _SCALAR_END.search(self.buf, self.pos) and self._read_more():
+                pass
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except JSONDecodeError as ex:
+                if self._is_cut(ex) and self._read_more():
+                    continue
+                raise
+
+            self.pos = end
+            return value
+
+
+def _iter_object(reader, array_keys):
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+        return
+
+    while True:
+        if reader.peek() != '"':
+            raise JSONDecodeError(
+                'Expecting property name enclosed in double quotes',
+                reader.buf, reader.pos
+            )
+        key = reader.value()
+        reader.expect(':')
+
+        if key in array_keys and reader.peek() == '[':
+            reader.pos += 1
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    yield key, reader.value(), True
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            yield key, reader.value(), False
+
+        if reader.expect(',}') == '}':
+            break
+
+
+def load_object(stream, element_handlers, chunk_size=const.IMPORT_READ_CHUNK_SIZE,
+                max_size=None):
+    ''' parses a JSON object from a binary stream without reading it whole:
+    elements of the arrays under the keys of element_handlers are passed to
+    the handlers one by one and these keys aren't put to the result;
+    a stream longer than max_size bytes is an error '''
+
+    reader = _ChunkReader(stream, chunk_size, max_size)
+
+    data = {}
+    for key, value, is_element in _iter_object(reader, element_handlers):
+        if is_element:
+            element_handlers[key](value)
+        else:
+            data[key] = value
+
+    if reader.peek():
+        raise JSONDecodeError('Extra data', reader.buf, reader.pos)
+
+    return data
@@ -0,0 +1,112 @@
+import json
+import statistics
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from prices_comparator.synthetic_catalog import generate_catalog
+
+
+class Command(BaseCommand):
+    help = ('Times imports, GET /nodes at every level and deletes on a synthetic catalog '
+            'through the views, all the changes are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10000, help='nodes in the catalog')
+        parser.add_argument('--depth', type=int, default=4, help='levels including the root')
+        parser.add_argument('--fanout', type=int, default=10, help='children per category')
+        parser.add_argument('--offer-ratio', type=float, default=0.2,
+                            help='part of offers among children above the last level')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--reads', type=int, default=10, help='GET /nodes per level')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='writes the results as JSON to this file')
+        parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+
+    def handle(self, *args, **options):
+        items, levels = generate_catalog(
+            options['size'], options['depth'], options['fanout'],
+            options['offer_ratio'], options['seed']
+        )
+
+        timings = {}
+        with override_settings(NODES_CACHE_MAX_BYTES=0, NODES_CACHE_ALIAS=None):
+            for __ in range(options['repeat']):
+                with transaction.atomic():
+                    self._run(items, levels, options['reads'], timings)
+                    transaction.set_rollback(True)
+
+        results = {
+            'commit': self._get_commit(),
+            'date': timezone.now().isoformat(),
+            'params': {k: options[k] for k in (
+                'size', 'depth', 'fanout', 'offer_ratio', 'repeat', 'reads', 'seed'
+            )},
+            'nodes': len(items),
+            'results': {
+                name: {'min': min(runs), 'median': statistics.median(runs), 'runs': runs}
+                for name, runs in timings.items()
+            },
+        }
+
+        self._write_table(results, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def _run(self, items, levels, reads, timings):
+        client = Client()
+
+        started = time.perf_counter()
+        self._check(client.post(
+            '/imports', content_type='application/json',
+            data=json.dumps({'updateDate': '2022-06-01T00:00:00.000Z', 'items': items})
+        ))
+        timings.setdefault('import', []).append(time.perf_counter() - started)
+
+        for level, ids in enumerate(levels):
+            runs = []
+            for i in range(reads):
+                started = time.perf_counter()
+                response = client.get(f'/nodes/{ids[i % len(ids)]}')
+                self._check(response)
+                if response.streaming:
+                    b''.join(response)
+                runs.append(time.perf_counter() - started)
+            timings.setdefault(f'nodes_level_{level}', []).append(statistics.median(runs))
+
+        started = time.perf_counter()
+        self._check(client.delete(f'/delete/{levels[0][0]}'))
+        timings.setdefault('delete_root', []).append(time.perf_counter() - started)
+
+    @staticmethod
+    def _check(response):
+        if response.status_code != 200:
+            raise CommandError(f'Unexpected status {response.status_code}')
+
+    @staticmethod
+    def _get_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _write_table(self, results, compare):
+        baseline = {}
+        if compare:
+            with open(compare) as f:
+                baseline = json.load(f)['results']
+
+        self.stdout.write('operation\tmin, s\tmedian, s' + ('\tchange' if baseline else ''))
+        for name, result in results['results'].items():
+            line = f'{name}\t{result["min"]:.4f}\t{result["median"]:.4f}'
+            if name in baseline:
+                change = result['median'] / baseline[name]['median'] - 1
+                line += f'\t{change:+.1%}'
+            self.stdout.write(line)
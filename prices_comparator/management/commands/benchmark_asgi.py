@@ -0,0 +1,118 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import AsyncClient, Client, override_settings
+
+from prices_comparator import async_db
+from prices_comparator.common import ItemType
+from prices_comparator.views import AsyncPricesComparatorView, PricesComparatorView
+from ybs_task.urls import get_urlpatterns
+
+
+class _SyncUrls:
+    urlpatterns = get_urlpatterns(PricesComparatorView)
+
+
+class _AsyncUrls:
+    urlpatterns = get_urlpatterns(AsyncPricesComparatorView)
+
+
+class Command(BaseCommand):
+    help = ('Compares GET /nodes throughput of the WSGI handler with threads '
+            'and the ASGI handler with async views, the catalog is removed afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=100)
+        parser.add_argument('--fanout', type=int, default=10, help='offers per category')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        category_ids = self._import_catalog(options['categories'], options['fanout'])
+        try:
+            rng = random.Random(0)
+            paths = [f'/nodes/{rng.choice(category_ids)}' for __ in range(options['requests'])]
+            concurrency = options['concurrency']
+
+            self.stdout.write('handler\tconcurrency\trequests/s')
+            for name, run in (('wsgi', self._run_wsgi), ('asgi', self._run_asgi)):
+                started = time.perf_counter()
+                run(paths, concurrency)
+                rps = len(paths) / (time.perf_counter() - started)
+                self.stdout.write(f'{name}\t{concurrency}\t{rps:.1f}')
+        finally:
+            self._delete_catalog(category_ids)
+
+    @staticmethod
+    def _check(response):
+        if response.status_code != 200:
+            raise CommandError(f'Unexpected status {response.status_code}')
+
+    def _import_catalog(self, categories, fanout):
+        items = []
+        category_ids = []
+        for i in range(categories):
+            category_id = str(uuid.uuid4())
+            category_ids.append(category_id)
+            items.append({
+                'id': category_id, 'name': f'category {i}',
+                'type': ItemType.CATEGORY.value, 'parentId': None
+            })
+            items.extend({
+                'id': str(uuid.uuid4()), 'name': f'offer {i}.{j}', 'price': j,
+                'type': ItemType.OFFER.value, 'parentId': category_id
+            } for j in range(fanout))
+
+        with override_settings(ROOT_URLCONF=_SyncUrls):
+            self._check(Client().post(
+                '/imports', content_type='application/json',
+                data=json.dumps({'updateDate': '2022-06-01T00:00:00.000Z', 'items': items})
+            ))
+        return category_ids
+
+    def _delete_catalog(self, category_ids):
+        with override_settings(ROOT_URLCONF=_SyncUrls):
+            client = Client()
+            for category_id in category_ids:
+                self._check(client.delete(f'/delete/{category_id}'))
+
+    def _run_wsgi(self, paths, concurrency):
+        ''' like a threaded WSGI server closing connections after the requests '''
+
+        local = threading.local()
+
+        def get(path):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            try:
+                self._check(local.client.get(path))
+            finally:
+                close_old_connections()
+
+        with override_settings(ROOT_URLCONF=_SyncUrls):
+            with ThreadPoolExecutor(concurrency) as executor:
+                list(executor.map(get, paths))
+
+    def _run_asgi(self, paths, concurrency):
+        async def run():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def get(path):
+                async with semaphore:
+                    self._check(await client.get(path))
+
+            try:
+                await asyncio.gather(*(get(path) for path in paths))
+            finally:
+                await async_db.close_pool()
+
+        with override_settings(ROOT_URLCONF=_AsyncUrls):
+            asyncio.run(run())
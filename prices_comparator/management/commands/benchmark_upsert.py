@@ -0,0 +1,62 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from prices_comparator.common import ItemType
+from prices_comparator.models import ImportModel
+from prices_comparator.upsert import UPSERT_ENGINE_BULK, UPSERT_ENGINE_COPY, upsert_models
+
+
+class Command(BaseCommand):
+    help = 'Compares import upsert engines on synthetic nodes, all the changes are rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='nodes in an import')
+        parser.add_argument('--fanout', type=int, default=10, help='offers per category')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.stdout.write('engine\tinsert, s\tupdate, s')
+        for engine in (UPSERT_ENGINE_BULK, UPSERT_ENGINE_COPY):
+            inserts, updates = [], []
+            for __ in range(options['repeat']):
+                models = self._generate_models(options['count'], options['fanout'])
+                with transaction.atomic():
+                    inserts.append(self._measure(engine, models))
+                    updates.append(self._measure(engine, models))
+                    transaction.set_rollback(True)
+
+            self.stdout.write(f'{engine}\t{min(inserts):.3f}\t{min(updates):.3f}')
+
+    @staticmethod
+    def _measure(engine, models):
+        started = time.perf_counter()
+        upsert_models(models, engine)
+        return time.perf_counter() - started
+
+    @staticmethod
+    def _generate_models(count, fanout):
+        date = timezone.now()
+        models = []
+        category = None
+        for i in range(count):
+            model_id = uuid.uuid4()
+            if i % (fanout + 1) == 0:
+                path = f'/{model_id}/'
+                category = ImportModel(
+                    id=model_id, name=f'category {i}', date=date, path=path,
+                    type=ItemType.CATEGORY.value, offers_count=fanout, price_sum=0
+                )
+                models.append(category)
+            else:
+                price = i % 1000
+                category.price_sum += price
+                models.append(ImportModel(
+                    id=model_id, name=f'offer {i}', date=date, parent_id=category,
+                    type=ItemType.OFFER.value, price=price, offers_count=1,
+                    price_sum=price, path=f'{category.path}{model_id}/'
+                ))
+        return models
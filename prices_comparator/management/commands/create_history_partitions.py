@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from prices_comparator.price_history import ensure_partitions
+
+
+class Command(BaseCommand):
+    help = ('Creates the price history partitions of the current month and the next ones, '
+            'run before a month starts, so the imports of the month find its partition')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=2)
+
+    def handle(self, *args, **options):
+        ensure_partitions(timezone.now(), options['months'])
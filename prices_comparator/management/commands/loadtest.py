@@ -0,0 +1,223 @@
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests as http
+from django.core.management.base import BaseCommand, CommandError
+
+from prices_comparator.common import ItemType
+from prices_comparator.http_client import HttpMixin
+from prices_comparator.synthetic_catalog import generate_catalog
+
+
+OPERATIONS = ('imports', 'nodes', 'delete')
+
+# upper bounds of the latency histogram buckets, ms
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf'))
+
+UPDATE_DATE = '2022-06-01T00:00:00.000Z'
+
+
+class _Client(HttpMixin):
+    ''' keeps connections to the service open '''
+
+    def __init__(self, host):
+        self._host = host
+        self._http = http.Session()
+        self._imports_url = self._get_imports_url()
+
+    def _get_host(self):
+        return self._host
+
+    def _get_imports_url(self):
+        return f'{self._host}/imports'
+
+    def _get_nodes_url(self):
+        return f'{self._host}/nodes/'
+
+    def _get_delete_url(self):
+        return f'{self._host}/delete/'
+
+
+class Command(BaseCommand):
+    help = ('Sends a mix of POST /imports, GET /nodes and DELETE at a target rate '
+            'to a running service and reports latency percentiles, errors and throughput')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=None,
+                            help='http://host:port, WEB_HOST and WEB_PORT by default')
+        parser.add_argument('--rate', type=float, default=50, help='requests per second')
+        parser.add_argument('--duration', type=float, default=30, help='seconds')
+        parser.add_argument('--mix', default='imports=1,nodes=8,delete=1',
+                            help='relative weights of the operations')
+        parser.add_argument('--workers', type=int, default=32, help='concurrent requests')
+        parser.add_argument('--catalog-size', type=int, default=2000,
+                            help='nodes of the catalog imported beforehand')
+        parser.add_argument('--batch', type=int, default=10, help='offers in an import')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='writes the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        self._host = options['host'] or HttpMixin._get_host()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._rng = random.Random(options['seed'])
+        self._batch = options['batch']
+
+        operations, weights = self._parse_mix(options['mix'])
+        items, levels = generate_catalog(options['catalog_size'], 4, 10, 0.2, options['seed'])
+        self._categories = [category_id for level in levels for category_id in level]
+        self._nodes = [item['id'] for item in items]
+        self._offers = []
+
+        self._check(self._get_client()._send_imports_post(
+            {'updateDate': UPDATE_DATE, 'items': items}
+        ))
+        try:
+            latencies, errors, elapsed = self._run(
+                operations, weights, options['rate'], options['duration'], options['workers']
+            )
+        finally:
+            self._check(self._get_client()._send_delete(levels[0][0]))
+
+        report = self._get_report(latencies, errors, elapsed)
+        self._write_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    @staticmethod
+    def _parse_mix(mix):
+        weights = {}
+        for part in mix.split(','):
+            name, __, weight = part.partition('=')
+            if name not in OPERATIONS:
+                raise CommandError(f'Unknown operation \'{name}\', use {", ".join(OPERATIONS)}')
+            weights[name] = float(weight or 1)
+        return list(weights), list(weights.values())
+
+    @staticmethod
+    def _check(response):
+        if response.status_code != 200:
+            raise CommandError(f'Unexpected status {response.status_code}')
+
+    def _get_client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = _Client(self._host)
+        return self._local.client
+
+    def _run(self, operations, weights, rate, duration, workers):
+        ''' open loop: requests are sent on schedule whether the previous ones
+        are answered or not, latencies are counted from the scheduled time '''
+
+        latencies = {name: [] for name in OPERATIONS}
+        errors = {name: 0 for name in OPERATIONS}
+
+        def send(name, scheduled):
+            try:
+                response = getattr(self, f'_send_{name}')()
+                if response is None:
+                    return
+                ok = response.status_code == 200
+            except http.RequestException:
+                ok = False
+            latency = time.perf_counter() - scheduled
+            with self._lock:
+                latencies[name].append(latency)
+                if not ok:
+                    errors[name] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(workers) as executor:
+            for i in range(int(rate * duration)):
+                scheduled = started + i / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                name = self._rng.choices(operations, weights)[0]
+                executor.submit(send, name, scheduled)
+
+        return latencies, errors, time.perf_counter() - started
+
+    def _send_imports(self):
+        with self._lock:
+            offers = [{
+                'id': str(uuid.uuid4()), 'name': 'load offer', 'type': ItemType.OFFER.value,
+                'price': self._rng.randint(1, 10000),
+                'parentId': self._rng.choice(self._categories),
+            } for __ in range(self._batch)]
+
+        response = self._get_client()._send_imports_post(
+            {'updateDate': UPDATE_DATE, 'items': offers}
+        )
+        if response.status_code == 200:
+            with self._lock:
+                self._offers.extend(offer['id'] for offer in offers)
+        return response
+
+    def _send_nodes(self):
+        with self._lock:
+            node_id = self._rng.choice(self._nodes)
+        return self._get_client()._send_nodes_get(node_id)
+
+    def _send_delete(self):
+        ''' only offers of the previous imports are deleted, the catalog stays intact,
+        nothing is sent until there are some '''
+
+        with self._lock:
+            if not self._offers:
+                return None
+            offer_id = self._offers.pop(self._rng.randrange(len(self._offers)))
+        return self._get_client()._send_delete(offer_id)
+
+    @staticmethod
+    def _get_percentile(sorted_values, percent):
+        ''' nearest rank '''
+
+        return sorted_values[max(0, math.ceil(len(sorted_values) * percent / 100) - 1)]
+
+    def _get_report(self, latencies, errors, elapsed):
+        report = {'elapsed': elapsed, 'operations': {}}
+        for name in OPERATIONS:
+            values = sorted(v * 1000 for v in latencies[name])
+            if not values:
+                continue
+
+            histogram, i = [], 0
+            for bound in HISTOGRAM_BUCKETS:
+                count = 0
+                while i < len(values) and values[i] <= bound:
+                    count += 1
+                    i += 1
+                histogram.append({'le': str(bound), 'count': count})
+
+            report['operations'][name] = {
+                'requests': len(values),
+                'errors': errors[name],
+                'errorRate': errors[name] / len(values),
+                'throughput': len(values) / elapsed,
+                'p50': self._get_percentile(values, 50),
+                'p95': self._get_percentile(values, 95),
+                'p99': self._get_percentile(values, 99),
+                'max': values[-1],
+                'histogram': histogram,
+            }
+        return report
+
+    def _write_report(self, report):
+        self.stdout.write('operation\trequests\terrors\trps\tp50, ms\tp95, ms\tp99, ms\tmax, ms')
+        for name, r in report['operations'].items():
+            self.stdout.write(
+                f'{name}\t{r["requests"]}\t{r["errors"]}\t{r["throughput"]:.1f}\t'
+                f'{r["p50"]:.1f}\t{r["p95"]:.1f}\t{r["p99"]:.1f}\t{r["max"]:.1f}'
+            )
+
+        for name, r in report['operations'].items():
+            self.stdout.write(f'\n{name} latency histogram, ms')
+            for bucket in r['histogram']:
+                if bucket['count']:
+                    self.stdout.write(f'<= {bucket["le"]}\t{bucket["count"]}')
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+import prices_comparator.common as const
+
+
+class Command(BaseCommand):
+    help = 'Recalculates subtree aggregates and paths of the nodes and compares them with the stored ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='overwrite the stored values which differ from the calculated ones'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'LOCK TABLE prices_comparator_importmodel IN SHARE ROW EXCLUSIVE MODE'
+            )
+
+            aggregates_diffs = self._get_aggregates_diffs(cursor)
+            for node_id, offers_count, price_sum, exp_offers_count, exp_price_sum in aggregates_diffs:
+                self.stdout.write(
+                    f'{node_id}: offers_count {offers_count} != {exp_offers_count}, '
+                    f'price_sum {price_sum} != {exp_price_sum}'
+                )
+
+            paths_diffs = self._get_paths_diffs(cursor)
+            for node_id, path, exp_path in paths_diffs:
+                self.stdout.write(f'{node_id}: path {path} != {exp_path}')
+
+            if options['fix']:
+                cursor.executemany('''UPDATE prices_comparator_importmodel
+                    SET offers_count = %s, price_sum = %s WHERE id = %s
+                ''', [(d[3], d[4], d[0]) for d in aggregates_diffs])
+                cursor.executemany('''UPDATE prices_comparator_importmodel
+                    SET path = %s WHERE id = %s
+                ''', [(d[2], d[0]) for d in paths_diffs])
+
+        diffs_count = len({d[0] for d in aggregates_diffs + paths_diffs})
+        if not diffs_count:
+            self.stdout.write('Aggregates and paths are consistent')
+        elif options['fix']:
+            self.stdout.write(f'Fixed {diffs_count} nodes')
+        else:
+            raise CommandError(f'{diffs_count} nodes are inconsistent')
+
+    @staticmethod
+    def _get_aggregates_diffs(cursor):
+        cursor.execute(f'''WITH expected AS ({const.CALC_AGGREGATES_SQL})
+            SELECT m.id, m.offers_count, m.price_sum,
+                COALESCE(e.offers_count, 0), COALESCE(e.price_sum, 0)
+            FROM prices_comparator_importmodel AS m
+            LEFT JOIN expected AS e ON e.node_id = m.id
+            WHERE m.offers_count <> COALESCE(e.offers_count, 0)
+                OR m.price_sum <> COALESCE(e.price_sum, 0)
+        ''')
+        return cursor.fetchall()
+
+    @staticmethod
+    def _get_paths_diffs(cursor):
+        cursor.execute(f'''WITH expected AS ({const.CALC_PATHS_SQL})
+            SELECT m.id, m.path, e.path
+            FROM prices_comparator_importmodel AS m
+            JOIN expected AS e ON e.node_id = m.id
+            WHERE m.path <> e.path
+        ''')
+        return cursor.fetchall()
@@ -0,0 +1,132 @@
+import os
+import time
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# text format version of generate_latest
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# with this directory in the environment of the worker processes they write
+# the metrics to files in it, so any of the processes reports the sums of them all
+MULTIPROC_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+
+
+REQUESTS = Counter(
+    'prices_comparator_requests', 'Requests by route, method and status',
+    ('route', 'method', 'status')
+)
+REQUEST_SECONDS = Histogram(
+    'prices_comparator_request_seconds', 'Time till the response is returned',
+    ('route', 'method'), buckets=LATENCY_BUCKETS
+)
+PHASE_SECONDS = Histogram(
+    'prices_comparator_phase_seconds', 'Time of the request phases', ('endpoint', 'phase'),
+    buckets=LATENCY_BUCKETS
+)
+IMPORT_BATCH_SIZE = Histogram(
+    'prices_comparator_import_batch_size', 'Items in an import', buckets=SIZE_BUCKETS
+)
+IMPORT_ROWS = Counter(
+    'prices_comparator_import_rows',
+    'Stored and imported nodes of imports written or skipped as unchanged', ('result',)
+)
+SUBTREE_SIZE = Histogram(
+    'prices_comparator_subtree_size', 'Nodes in a subtree read by GET /nodes',
+    buckets=SIZE_BUCKETS
+)
+
+
+def time_phase(endpoint, phase):
+    return PHASE_SECONDS.labels(endpoint=endpoint, phase=phase).time()
+
+
+def observe_read(endpoint, read_seconds, serialize_seconds, rows_count):
+    ''' the phases of a response whose reading and serializing are interleaved '''
+
+    PHASE_SECONDS.labels(endpoint=endpoint, phase='read').observe(read_seconds)
+    PHASE_SECONDS.labels(endpoint=endpoint, phase='serialize').observe(max(serialize_seconds, 0))
+    SUBTREE_SIZE.observe(rows_count)
+
+
+def observe_phase(endpoint, phase, seconds):
+    PHASE_SECONDS.labels(endpoint=endpoint, phase=phase).observe(seconds)
+
+
+class CallTimer:
+    ''' a callback whose calls are timed, their time belongs to another phase
+    than the one of the code calling it '''
+
+    def __init__(self, callback):
+        self._callback = callback
+        self.seconds = 0.0
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._callback(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+class RowsTimer:
+    ''' rows of a cursor fetched by batches, the time of fetching them is summed '''
+
+    def __init__(self, cursor, batch_size=2000):
+        self._cursor = cursor
+        self._batch_size = batch_size
+        self.read_seconds = 0.0
+        self.count = 0
+
+    def __iter__(self):
+        while True:
+            started = time.perf_counter()
+            rows = self._cursor.fetchmany(self._batch_size)
+            self.read_seconds += time.perf_counter() - started
+            if not rows:
+                return
+            self.count += len(rows)
+            yield from rows
+
+
+def iter_timed_chunks(parts, endpoint, rows_timer, chunk_length=64 * 1024):
+    ''' joins the parts of a streamed response to chunks, the time spent producing
+    them apart from reading the rows goes to the serialize phase; the time the
+    generator waits for the chunks to be sent isn't counted '''
+
+    parts = iter(parts)
+    busy_seconds = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            chunk, length = [], 0
+            for part in parts:
+                chunk.append(part)
+                length += len(part)
+                if length >= chunk_length:
+                    break
+            busy_seconds += time.perf_counter() - started
+
+            if not chunk:
+                return
+            yield ''.join(chunk)
+    finally:
+        observe_read(
+            endpoint, rows_timer.read_seconds, busy_seconds - rows_timer.read_seconds,
+            rows_timer.count
+        )
+
+
+def render_metrics():
+    ''' the metrics of all the worker processes with PROMETHEUS_MULTIPROC_DIR,
+    of this process only without it '''
+
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,245 @@
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from prices_comparator.metrics import REQUEST_SECONDS, REQUESTS
+
+
+# stats of the current request, the context is copied to the threads of async views
+_request_stats = ContextVar('request_stats', default=None)
+
+
+def record_sql(seconds, rows, queries=1):
+    ''' the queries and rows the execute wrapper doesn't see: the ones of asyncpg
+    and the rows fetched from server-side cursors by the streamed responses '''
+
+    stats = _request_stats.get()
+    if stats is not None:
+        stats['sqlTime'] += seconds
+        stats['sqlQueries'] += queries
+        stats['rows'] += rows
+
+
+def _record_sql(execute, sql, params, many, context):
+    if _request_stats.get() is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        rowcount = context['cursor'].rowcount
+        record_sql(time.perf_counter() - started, max(rowcount, 0))
+
+
+def _add_sql_recorder(connection, **kwargs):
+    if _record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_sql)
+
+
+class ProfilingMiddleware:
+    ''' writes wall time till the response is returned, number and time of sql queries
+    and rows of every request as a JSON line to PROFILING_DIR/requests.jsonl;
+    a sample of the requests is run under cProfile and the ones slower than
+    PROFILING_SLOW_MS are dumped to .prof files, as well as the ones having
+    X-Profile header; without PROFILING_DIR it's removed from the chain;
+    a streamed response is read after it's returned, its queries and rows
+    are counted as its chunks are made, and the line is written at its end '''
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_DIR:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        self._dir = settings.PROFILING_DIR
+        self._lock = threading.Lock()
+        os.makedirs(self._dir, exist_ok=True)
+        connection_created.connect(_add_sql_recorder)
+        self._loop_profiled = False
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+
+        stats, token, profiler = self._start(request)
+        started = time.perf_counter()
+        try:
+            if profiler:
+                response = profiler.runcall(self.get_response, request)
+            else:
+                response = self.get_response(request)
+        finally:
+            wall_time = time.perf_counter() - started
+            _request_stats.reset(token)
+
+        if response.streaming:
+            self._record_stream(request, response, stats, profiler, wall_time)
+        else:
+            self._write_record(request, response, stats, profiler, wall_time)
+        return response
+
+    def _record_stream(self, request, response, stats, profiler, wall_time):
+        iter_recorded = self._aiter_recorded if response.is_async else self._iter_recorded
+        response.streaming_content = iter_recorded(
+            response.streaming_content, request, response, stats, profiler, wall_time
+        )
+
+    def _iter_recorded(self, content, request, response, stats, profiler, wall_time):
+        ''' the stats are set only while a chunk is made, the server runs
+        other code of its thread between them '''
+
+        content = iter(content)
+        try:
+            while True:
+                token = _request_stats.set(stats)
+                try:
+                    chunk = next(content, None)
+                finally:
+                    _request_stats.reset(token)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self._write_record(request, response, stats, profiler, wall_time)
+
+    async def _acall(self, request):
+        ''' the profile has the event loop thread only, the async views run their
+        handlers in threads of the pool; a thread is profiled by one profiler
+        at a time, so the requests coming while one is profiled aren't '''
+
+        stats, token, profiler = self._start(request)
+        if self._loop_profiled:
+            profiler = None
+        if profiler:
+            self._loop_profiled = True
+            profiler.enable()
+
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            wall_time = time.perf_counter() - started
+            _request_stats.reset(token)
+            if profiler:
+                profiler.disable()
+                self._loop_profiled = False
+
+        if response.streaming:
+            self._record_stream(request, response, stats, profiler, wall_time)
+        else:
+            await sync_to_async(self._write_record, thread_sensitive=False)(
+                request, response, stats, profiler, wall_time
+            )
+        return response
+
+    async def _aiter_recorded(self, content, request, response, stats, profiler, wall_time):
+        ''' the stats are copied to the threads making the chunks of sync streams '''
+
+        content = content.__aiter__()
+        try:
+            while True:
+                token = _request_stats.set(stats)
+                try:
+                    chunk = await content.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _request_stats.reset(token)
+                yield chunk
+        finally:
+            await sync_to_async(self._write_record, thread_sensitive=False)(
+                request, response, stats, profiler, wall_time
+            )
+
+    def _start(self, request):
+        for connection in connections.all():
+            _add_sql_recorder(connection)
+
+        stats = {'sqlQueries': 0, 'sqlTime': 0.0, 'rows': 0}
+        token = _request_stats.set(stats)
+
+        profiler = None
+        if 'HTTP_X_PROFILE' in request.META or random.random() < settings.PROFILING_SAMPLE_RATE:
+            profiler = cProfile.Profile()
+        return stats, token, profiler
+
+    def _write_record(self, request, response, stats, profiler, wall_time):
+        forced = 'HTTP_X_PROFILE' in request.META
+        record = {
+            'date': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'wallTime': wall_time,
+            **stats,
+        }
+        if profiler and (forced or wall_time * 1000 >= settings.PROFILING_SLOW_MS):
+            record['profile'] = self._dump_profile(profiler, request)
+
+        with self._lock:
+            with open(os.path.join(self._dir, 'requests.jsonl'), 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def _dump_profile(self, profiler, request):
+        ''' the dump is read by pstats, snakeviz or flameprof for a flame graph '''
+
+        name = '{:.6f}-{}-{}.prof'.format(
+            time.time(), request.method,
+            request.path.strip('/').replace('/', '_')
+        )
+        path = os.path.join(self._dir, name)
+        profiler.dump_stats(path)
+        return path
+
+
+class MetricsMiddleware:
+    ''' counts requests and their time by routes, it's async capable,
+    so it doesn't move async views to a thread '''
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    async def _acall(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    @staticmethod
+    def _observe(request, response, started):
+        match = request.resolver_match
+        route = match.route if match else 'unmatched'
+        REQUEST_SECONDS.labels(route=route, method=request.method).observe(
+            time.perf_counter() - started
+        )
+        REQUESTS.labels(route=route, method=request.method, status=response.status_code).inc()
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_comparator', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importmodel',
+            name='offers_count',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importmodel',
+            name='price_sum',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            sql='''WITH RECURSIVE offer_ancestor(node_id, price) AS (
+                    SELECT id, price FROM prices_comparator_importmodel
+                    WHERE "type" = 'OFFER'
+                UNION ALL
+                    SELECT n.parent_id_id, oa.price
+                    FROM offer_ancestor AS oa
+                    JOIN prices_comparator_importmodel AS n ON n.id = oa.node_id
+                    WHERE n.parent_id_id IS NOT NULL)
+                UPDATE prices_comparator_importmodel AS m
+                SET offers_count = a.offers_count, price_sum = a.price_sum
+                FROM (
+                    SELECT node_id, COUNT(*) AS offers_count, COALESCE(SUM(price), 0) AS price_sum
+                    FROM offer_ancestor GROUP BY node_id
+                ) AS a
+                WHERE m.id = a.node_id
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_comparator', '0002_importmodel_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importmodel',
+            name='path',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunSQL(
+            sql='''WITH RECURSIVE node(id, path) AS (
+                    SELECT id, '/' || id || '/' FROM prices_comparator_importmodel
+                    WHERE parent_id_id IS NULL
+                UNION ALL
+                    SELECT ch.id, n.path || ch.id || '/'
+                    FROM prices_comparator_importmodel AS ch, node AS n
+                    WHERE ch.parent_id_id = n.id)
+                UPDATE prices_comparator_importmodel AS m
+                SET path = node.path FROM node WHERE m.id = node.id
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='importmodel',
+            index=models.Index(
+                fields=['path'], name='importmodel_path_idx',
+                opclasses=['text_pattern_ops']
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_comparator', '0003_importmodel_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importmodel',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importmodel',
+            name='modified',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunSQL(
+            sql='CREATE SEQUENCE prices_comparator_importmodel_version_seq',
+            reverse_sql='DROP SEQUENCE prices_comparator_importmodel_version_seq',
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_comparator', '0004_importmodel_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='importmodel',
+            index=models.Index(fields=['parent_id', 'id'], name='importmodel_parent_id_idx'),
+        ),
+    ]
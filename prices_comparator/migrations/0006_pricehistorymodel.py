@@ -0,0 +1,52 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_comparator', '0005_importmodel_parent_id_idx'),
+    ]
+
+    operations = [
+        # django can't create a partitioned table, its primary key has to include the date
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=['''CREATE TABLE prices_comparator_pricehistorymodel (
+                            id bigint GENERATED BY DEFAULT AS IDENTITY,
+                            node_id uuid NOT NULL,
+                            name varchar(200) NOT NULL,
+                            date timestamp with time zone NOT NULL,
+                            parent_id uuid NULL,
+                            type varchar(200) NOT NULL,
+                            price bigint NULL CHECK (price >= 0),
+                            offers_count bigint NOT NULL CHECK (offers_count >= 0),
+                            price_sum bigint NOT NULL CHECK (price_sum >= 0),
+                            PRIMARY KEY (id, date)
+                        ) PARTITION BY RANGE (date)''',
+                        '''CREATE INDEX pricehistory_node_id_date_idx
+                            ON prices_comparator_pricehistorymodel (node_id, date)'''],
+                    reverse_sql='DROP TABLE prices_comparator_pricehistorymodel',
+                ),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='PriceHistoryModel',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('node_id', models.UUIDField()),
+                        ('name', models.CharField(max_length=200)),
+                        ('date', models.DateTimeField()),
+                        ('parent_id', models.UUIDField(null=True)),
+                        ('type', models.CharField(choices=[('OFFER', 'OFFER'), ('CATEGORY', 'CATEGORY')], max_length=200)),
+                        ('price', models.PositiveBigIntegerField(blank=True, null=True)),
+                        ('offers_count', models.PositiveBigIntegerField(default=0)),
+                        ('price_sum', models.PositiveBigIntegerField(default=0)),
+                    ],
+                    options={
+                        'indexes': [models.Index(fields=['node_id', 'date'], name='pricehistory_node_id_date_idx')],
+                    },
+                ),
+            ],
+        ),
+    ]
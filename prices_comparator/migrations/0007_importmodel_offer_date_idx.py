@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_comparator', '0006_pricehistorymodel'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='importmodel',
+            index=models.Index(condition=models.Q(('type', 'OFFER')), fields=['date'], include=('id', 'name', 'parent_id', 'price'), name='importmodel_offer_date_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_comparator', '0007_importmodel_offer_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='importmodel',
+            constraint=models.CheckConstraint(check=models.Q(('path', ''), _negated=True), name='importmodel_path_not_empty'),
+        ),
+        migrations.RunSQL(
+            sql='''CREATE FUNCTION prices_comparator_path_end(path text) RETURNS text
+                LANGUAGE plpgsql IMMUTABLE STRICT AS $$
+                BEGIN
+                    IF path = '' THEN
+                        RAISE EXCEPTION 'Empty path matches all the nodes';
+                    END IF;
+                    RETURN left(path, -1) || '0';
+                END
+                $$''',
+            reverse_sql='DROP FUNCTION prices_comparator_path_end(text)',
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def create_partitions(apps, schema_editor):
+    # the partitions of the current and the next month, later ones are created
+    # by the create_history_partitions command
+    from prices_comparator.price_history import ensure_partitions
+    ensure_partitions(timezone.now(), 2)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_comparator', '0008_importmodel_path_not_empty'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_partitions, migrations.RunPython.noop),
+    ]
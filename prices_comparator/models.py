@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from bulk_update_or_create import BulkUpdateOrCreateQuerySet
 
@@ -17,3 +18,62 @@ class ImportModel(models.Model):
         max_length=const.IMPORT_UNIT_NAME_MAX_LENGTH
     )
     price = models.PositiveBigIntegerField(blank=True, null=True)
+
+    # subtree aggregates, the node itself included (an offer counts itself)
+    offers_count = models.PositiveBigIntegerField(default=0)
+    price_sum = models.PositiveBigIntegerField(default=0)
+
+    # materialized path '/<root id>/.../<own id>/'
+    path = models.TextField(default='')
+
+    # changed with the node subtree, version is taken from VERSION_SEQUENCE
+    version = models.BigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+    VERSION_SEQUENCE = 'prices_comparator_importmodel_version_seq'
+
+    # the upper bound of the paths range of the subtree of a path, raises on an empty
+    # path, whose range would be the whole table
+    PATH_END_FUNCTION = 'prices_comparator_path_end'
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['path'], name='importmodel_path_idx',
+                opclasses=['text_pattern_ops']
+            ),
+            # pages of children in id order
+            models.Index(fields=['parent_id', 'id'], name='importmodel_parent_id_idx'),
+            # GET /sales is read by index only scans
+            models.Index(
+                fields=['date'], name='importmodel_offer_date_idx',
+                include=['id', 'name', 'parent_id', 'price'],
+                condition=models.Q(type=const.ItemType.OFFER.value)
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(check=~models.Q(path=''), name='importmodel_path_not_empty'),
+        ]
+
+
+class PriceHistoryModel(models.Model):
+    ''' append-only states of the nodes written by imports, the table is
+    partitioned by months of the date, see price_history '''
+
+    id = models.BigAutoField(primary_key=True)
+    node_id = models.UUIDField()
+    name = models.CharField(max_length=const.IMPORT_UNIT_NAME_MAX_LENGTH)
+    date = models.DateTimeField()
+    parent_id = models.UUIDField(null=True)
+    type = models.CharField(
+        choices=const.IMPORT_UNIT_TYPE_CHOICES,
+        max_length=const.IMPORT_UNIT_NAME_MAX_LENGTH
+    )
+    price = models.PositiveBigIntegerField(blank=True, null=True)
+    offers_count = models.PositiveBigIntegerField(default=0)
+    price_sum = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['node_id', 'date'], name='pricehistory_node_id_date_idx'),
+        ]
@@ -0,0 +1,114 @@
+from json.encoder import encode_basestring_ascii
+
+from prices_comparator.common import ItemType
+
+
+# columns of the rows the serializer takes, in this order
+NODE_COLUMNS = (
+    'id', 'name', 'date', 'parent_id_id', 'type', 'price', 'offers_count', 'price_sum', 'path'
+)
+ID, NAME, DATE, PARENT_ID, TYPE, PRICE, OFFERS_COUNT, PRICE_SUM, PATH = range(len(NODE_COLUMNS))
+
+
+class NodeSerializer:
+    ''' JSON of nodes built from row tuples, it's the same byte for byte
+    as json.dumps of the node dicts the API describes '''
+
+    def __init__(self):
+        # the nodes of an import share the date
+        self._dates = {}
+        # the paths of the categories of the subtree emitted which aren't closed yet
+        self._opened_paths = []
+        self._has_children = False
+
+    def _format_date(self, date):
+        formatted = self._dates.get(date, None)
+        if formatted is None:
+            formatted = date.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+            self._dates[date] = formatted
+        return formatted
+
+    @staticmethod
+    def _get_price(row):
+        ''' a category price is the average of the offers of its subtree '''
+
+        if row[TYPE] == ItemType.CATEGORY.value:
+            offers_count = row[OFFERS_COUNT]
+            return row[PRICE_SUM] // offers_count if offers_count else None
+        return row[PRICE]
+
+    def _dumps_fields(self, row):
+        price = self._get_price(row)
+        parent_id = row[PARENT_ID]
+        return ''.join((
+            '{"id": "', str(row[ID]),
+            '", "name": ', encode_basestring_ascii(row[NAME]),
+            ', "date": "', self._format_date(row[DATE]),
+            '", "type": ', encode_basestring_ascii(row[TYPE]),
+            ', "price": ', 'null' if price is None else str(price),
+            ', "parentId": ', 'null' if parent_id is None else f'"{parent_id}"',
+        ))
+
+    def open(self, row):
+        ''' a category is left open to be followed by its children and ']}' '''
+
+        if row[TYPE] == ItemType.CATEGORY.value:
+            return self._dumps_fields(row) + ', "children": ['
+        return self._dumps_fields(row) + ', "children": null}'
+
+    def iter_units(self, rows):
+        ''' {"items": [...]} of the nodes without children '''
+
+        yield '{"items": ['
+        for i, row in enumerate(rows):
+            yield (', ' if i else '') + self._dumps_fields(row) + '}'
+        yield ']}'
+
+    def to_dict(self, row):
+        ''' the node as json.loads gives it back from open() '''
+
+        parent_id = row[PARENT_ID]
+        return {
+            'id': str(row[ID]),
+            'name': row[NAME],
+            'date': self._format_date(row[DATE]),
+            'type': row[TYPE],
+            'price': self._get_price(row),
+            'parentId': None if parent_id is None else str(parent_id),
+            'children': [] if row[TYPE] == ItemType.CATEGORY.value else None,
+        }
+
+    def iter_subtree(self, rows):
+        ''' emits the subtree in one pass over its rows ordered by path: the first row
+        is the subtree root and every node is followed by its subtree, so no tree
+        is built and the nesting is tracked by the paths of the open categories '''
+
+        yield from self.iter_subtree_part(rows)
+        yield self.close_subtree()
+
+    def iter_subtree_part(self, rows):
+        ''' the subtree rows read by parts go one part after another, the open
+        categories are kept between them till close_subtree() '''
+
+        opened_paths = self._opened_paths
+        has_children = self._has_children
+        for row in rows:
+            while opened_paths and not row[PATH].startswith(opened_paths[-1]):
+                opened_paths.pop()
+                has_children = True
+                yield ']}'
+
+            if has_children:
+                yield ', '
+            yield self.open(row)
+
+            has_children = row[TYPE] != ItemType.CATEGORY.value
+            if not has_children:
+                opened_paths.append(row[PATH])
+        self._has_children = has_children
+
+    def close_subtree(self):
+        closing = ']}' * len(self._opened_paths)
+        self._opened_paths = []
+        self._has_children = False
+        return closing
@@ -0,0 +1,130 @@
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+CachedNode = namedtuple('CachedNode', ('content', 'etag', 'last_modified'))
+
+
+class NodesCache:
+    ''' serialized GET /nodes responses by node id: an in-process LRU bounded
+    by the total size of the responses or a shared backend from CACHES;
+    an entry is valid only for the node version of its etag, the version
+    is read before the subtree and changes with it, so a response read
+    concurrently with a change can't be served for a later version '''
+
+    def __init__(self, max_bytes, backend=None):
+        self._max_bytes = max_bytes
+        self._backend = backend
+        # guards the LRU and the counters, the backend is called without it
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(node_id):
+        return str(uuid.UUID(str(node_id)))
+
+    def get(self, node_id, etag):
+        ''' returns CachedNode of the node version or None '''
+
+        key = self._key(node_id)
+        if self._backend:
+            entry = self._backend.get(key, None)
+            entry = CachedNode(*entry) if entry else None
+
+        with self._lock:
+            if not self._backend:
+                entry = self._entries.get(key, None)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+
+            if entry is None or entry.etag != etag:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return entry
+
+    def set(self, node_id, entry):
+        key = self._key(node_id)
+        if self._backend:
+            self._backend.set(key, tuple(entry))
+            return
+
+        if len(entry.content) > self._max_bytes:
+            return
+
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._size -= len(old_entry.content)
+
+            self._entries[key] = entry
+            self._size += len(entry.content)
+            while self._size > self._max_bytes:
+                __, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.content)
+                self.evictions += 1
+
+    def invalidate(self, node_ids):
+        ''' drops the outdated entries to free the space early '''
+
+        keys = [self._key(node_id) for node_id in node_ids]
+        if self._backend:
+            self._backend.delete_many(keys)
+
+        with self._lock:
+            self.invalidations += len(keys)
+            if self._backend:
+                return
+
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._size -= len(entry.content)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'shared' if self._backend else 'local',
+                'entries': None if self._backend else len(self._entries),
+                'bytes': None if self._backend else self._size,
+                'maxBytes': None if self._backend else self._max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+_nodes_cache = None
+
+
+def get_nodes_cache():
+    ''' None when the cache is disabled '''
+
+    global _nodes_cache
+    if _nodes_cache is None:
+        if settings.NODES_CACHE_ALIAS:
+            _nodes_cache = NodesCache(0, caches[settings.NODES_CACHE_ALIAS])
+        elif settings.NODES_CACHE_MAX_BYTES > 0:
+            _nodes_cache = NodesCache(settings.NODES_CACHE_MAX_BYTES)
+    return _nodes_cache
+
+
+@receiver(setting_changed)
+def _reset_nodes_cache(setting, **kwargs):
+    global _nodes_cache
+    if setting in ('NODES_CACHE_ALIAS', 'NODES_CACHE_MAX_BYTES'):
+        _nodes_cache = None
@@ -0,0 +1,60 @@
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+
+from prices_comparator.pooled_postgresql.pool import close_pools, get_pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    ''' pooled connections to the test database don't let to drop it '''
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        self.connection.close_pool()
+        return super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    ''' postgresql backend taking connections from a pool of the process
+    when the database settings have POOL with MAX_SIZE, closing a connection
+    returns it to the pool, so CONN_MAX_AGE has to be 0 '''
+
+    creation_class = DatabaseCreation
+
+    _connection_pool = None
+
+    def _get_connection_pool(self, conn_params):
+        options = self.settings_dict.get('POOL', None)
+        if self.alias == NO_DB_ALIAS or not options or not options.get('MAX_SIZE'):
+            return None
+
+        key = tuple(sorted((k, str(v)) for k, v in conn_params.items()))
+        return get_pool(self.alias, key, options)
+
+    def get_new_connection(self, conn_params):
+        pool = self._get_connection_pool(conn_params)
+        self._connection_pool = pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        def connect():
+            connection = super(DatabaseWrapper, self).get_new_connection(conn_params)
+            pool.isolation_level = self.isolation_level
+            return connection
+
+        connection = pool.acquire(connect)
+        self.isolation_level = pool.isolation_level
+        return connection
+
+    def _close(self):
+        pool = self._connection_pool
+        if self.connection is None or pool is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            pool.release(self.connection)
+        self.connection = None
+
+    def close_pool(self):
+        close_pools(self.alias)
+        super_close_pool = getattr(super(), 'close_pool', None)
+        if super_close_pool:
+            super_close_pool()
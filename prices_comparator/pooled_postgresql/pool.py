@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+
+from django.db.backends.postgresql.base import Database
+
+
+class PoolTimeout(Database.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    ''' db connections of a process: up to max_size are open, idle ones above
+    min_size are closed after max_idle seconds, the ones idle for check_idle
+    seconds are checked before they are given out '''
+
+    def __init__(self, min_size, max_size, timeout, check_idle, max_idle):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_idle = max_idle
+        self.pid = os.getpid()
+
+        # the isolation level the connections are opened with
+        self.isolation_level = None
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._closed = False
+
+        self.waiting = 0
+        self.acquires = 0
+        self.acquire_time = 0.0
+        self.max_acquire_time = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.health_check_failures = 0
+
+    def acquire(self, connect):
+        ''' returns an idle connection or a new one made by connect() '''
+
+        started = time.monotonic()
+        with self._cond:
+            self.waiting += 1
+            try:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = self.timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f'No connection is released in {self.timeout} s, '
+                            f'all {self.max_size} are in use'
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+            if self._idle:
+                connection, released = self._idle.pop()
+            else:
+                connection, released = None, None
+                self._size += 1
+            self._close_expired(time.monotonic())
+
+        if connection is not None and not self._is_healthy(connection, released):
+            with self._cond:
+                self.health_check_failures += 1
+            self._close_connection(connection)
+            connection = None
+
+        if connection is None:
+            try:
+                connection = connect()
+            except BaseException:
+                self._discard()
+                raise
+            with self._cond:
+                self.connects += 1
+
+        with self._cond:
+            elapsed = time.monotonic() - started
+            self.acquires += 1
+            self.acquire_time += elapsed
+            self.max_acquire_time = max(self.max_acquire_time, elapsed)
+        return connection
+
+    def release(self, connection):
+        ''' a connection left in a transaction is rolled back and the session state
+        (settings, temp tables, held cursors, prepared statements, advisory locks)
+        is reset to the one of a new connection, a broken one is closed '''
+
+        try:
+            if not connection.closed:
+                if (connection.get_transaction_status()
+                        != Database.extensions.TRANSACTION_STATUS_IDLE):
+                    connection.rollback()
+                # DISCARD ALL can't be run in a transaction block
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute('DISCARD ALL')
+        except Database.Error:
+            self._close_connection(connection)
+
+        if connection.closed or self._closed:
+            self._close_connection(connection)
+            self._discard()
+            return
+
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        ''' idle connections are closed at once, the used ones when released '''
+
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for connection, __ in idle:
+            self._close_connection(connection)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'inUse': self._size - len(self._idle),
+                'idle': len(self._idle),
+                'waiting': self.waiting,
+                'minSize': self.min_size,
+                'maxSize': self.max_size,
+                'acquires': self.acquires,
+                'acquireTimeAvg': self.acquire_time / self.acquires if self.acquires else 0,
+                'acquireTimeMax': self.max_acquire_time,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'healthCheckFailures': self.health_check_failures,
+            }
+
+    def _is_healthy(self, connection, released):
+        if connection.closed:
+            return False
+        if time.monotonic() - released < self.check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Database.Error:
+            return False
+
+    def _close_expired(self, now):
+        ''' the idle list is used as a stack, so the oldest ones are at its bottom,
+        must be called under the lock '''
+
+        expired = 0
+        while (self._size - expired > self.min_size and expired < len(self._idle)
+               and now - self._idle[expired][1] > self.max_idle):
+            expired += 1
+
+        if expired:
+            for connection, __ in self._idle[:expired]:
+                self._close_connection(connection)
+            del self._idle[:expired]
+            self._size -= expired
+
+    def _discard(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_connection(connection):
+        try:
+            connection.close()
+        except Database.Error:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, key, options):
+    ''' a pool per database settings; pools inherited from a parent process
+    are left to it, their sockets are shared '''
+
+    with _pools_lock:
+        pool = _pools.get((alias, key), None)
+        if pool is None or pool.pid != os.getpid():
+            pool = ConnectionPool(
+                min_size=options.get('MIN_SIZE', 0),
+                max_size=options['MAX_SIZE'],
+                timeout=options.get('TIMEOUT', 30),
+                check_idle=options.get('CHECK_IDLE', 30),
+                max_idle=options.get('MAX_IDLE', 600),
+            )
+            _pools[(alias, key)] = pool
+        return pool
+
+
+def close_pools(alias):
+    with _pools_lock:
+        keys = [k for k in _pools if k[0] == alias]
+        pools = [_pools.pop(k) for k in keys]
+    for pool in pools:
+        if pool.pid == os.getpid():
+            pool.close()
+
+
+def get_pools_stats():
+    with _pools_lock:
+        pools = [(alias, pool) for (alias, __), pool in _pools.items() if pool.pid == os.getpid()]
+    return {alias: pool.stats() for alias, pool in pools}
@@ -0,0 +1,96 @@
+import datetime
+
+from django.db import connection, transaction
+
+from prices_comparator.models import PriceHistoryModel
+from prices_comparator.node_serializer import NODE_COLUMNS
+
+
+HISTORY_TABLE = PriceHistoryModel._meta.db_table
+
+# NODE_COLUMNS of a history row, it has no path
+_HISTORY_COLUMNS = ', '.join(
+    {'id': 'node_id', 'parent_id_id': 'parent_id', 'path': "'' AS path"}.get(column, column)
+    for column in NODE_COLUMNS
+)
+
+
+def _get_month_range(date):
+    start = datetime.datetime(date.year, date.month, 1, tzinfo=datetime.timezone.utc)
+    if date.month == 12:
+        end = start.replace(year=date.year + 1, month=1)
+    else:
+        end = start.replace(month=date.month + 1)
+    return start, end
+
+
+def get_partition_name(date):
+    return f'{HISTORY_TABLE}_p{date.year:04}{date.month:02}'
+
+
+def ensure_partition(date):
+    ''' the table is partitioned by months of the date; CREATE TABLE PARTITION OF
+    locks the whole table ACCESS EXCLUSIVE till the commit, so the partition
+    is created in a short transaction of its own, the writes of the history
+    must call it before theirs, an advisory lock keeps concurrent requests
+    from creating it twice '''
+
+    date = date.astimezone(datetime.timezone.utc)
+    name = get_partition_name(date)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0]:
+            return
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [name])
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0]:
+            return
+
+        start, end = _get_month_range(date)
+        cursor.execute(
+            f'CREATE TABLE {name} PARTITION OF {HISTORY_TABLE} FOR VALUES FROM (%s) TO (%s)',
+            [start, end]
+        )
+
+
+def ensure_partitions(date, months):
+    ''' the partitions of the month of the date and the next ones '''
+
+    for __ in range(months):
+        ensure_partition(date)
+        __, date = _get_month_range(date)
+
+
+def write_history(ids, date):
+    ''' appends the stored state of the nodes as of the date, must be called
+    in the transaction the nodes are written in, after ensure_partition(date) '''
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'''INSERT INTO {HISTORY_TABLE}
+            (node_id, name, date, parent_id, type, price, offers_count, price_sum)
+            SELECT id, name, %s, parent_id_id, type, price, offers_count, price_sum
+            FROM prices_comparator_importmodel WHERE id = ANY(%s::uuid[])
+        ''', [date, '{' + ','.join(str(i) for i in ids) + '}'])
+
+
+def get_history(node_id, date_start=None, date_end=None):
+    ''' rows of the node updated in [date_start, date_end) in NODE_COLUMNS order,
+    the bounds are sent as literals, so only their partitions are planned '''
+
+    conditions, params = ['node_id = %s'], [str(node_id)]
+    if date_start:
+        conditions.append('date >= %s')
+        params.append(date_start)
+    if date_end:
+        conditions.append('date < %s')
+        params.append(date_end)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT {_HISTORY_COLUMNS} FROM {HISTORY_TABLE} '
+            f'WHERE {" AND ".join(conditions)} ORDER BY date, id',
+            params
+        )
+        return cursor.fetchall()
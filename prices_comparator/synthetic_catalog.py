@@ -0,0 +1,43 @@
+import random
+import uuid
+from collections import deque
+
+from prices_comparator.common import ItemType
+
+
+def generate_catalog(size, depth, fanout, offer_ratio, seed=0):
+    ''' import items of a tree of at most size nodes built breadth-first from a root category:
+    categories above the last level get fanout children, offer_ratio of them are offers,
+    the last level is offers only; returns the items and category ids by levels '''
+
+    rng = random.Random(seed)
+
+    def new_id():
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    root_id = new_id()
+    items = [{
+        'id': root_id, 'name': 'category 0', 'type': ItemType.CATEGORY.value, 'parentId': None
+    }]
+    levels = [[root_id]]
+
+    queue = deque([(root_id, 0)])
+    while queue and len(items) < size:
+        parent_id, level = queue.popleft()
+        for __ in range(fanout):
+            if len(items) >= size:
+                break
+
+            is_offer = level + 1 >= depth - 1 or rng.random() < offer_ratio
+            item = {'id': new_id(), 'name': f'node {len(items)}', 'parentId': parent_id}
+            if is_offer:
+                item.update(type=ItemType.OFFER.value, price=rng.randint(1, 10000))
+            else:
+                item.update(type=ItemType.CATEGORY.value)
+                queue.append((item['id'], level + 1))
+                if len(levels) <= level + 1:
+                    levels.append([])
+                levels[level + 1].append(item['id'])
+            items.append(item)
+
+    return items, levels
@@ -1,45 +1,44 @@
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, InternalError, connection, connections, transaction
+from django.forms import ValidationError
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
+from asgiref.sync import sync_to_async
+from prometheus_client import REGISTRY
 
-import requests as http
+import asyncio
+import datetime
 import json
+import io
 import os
 import copy
-
+import re
+import tempfile
+import subprocess
+import sys
+import threading
+import time
+import unittest.mock
+from concurrent.futures import ThreadPoolExecutor
+
+import prices_comparator.common as const
+from prices_comparator import async_db, json_stream, metrics
 from prices_comparator.common import ItemType
-
-
-class HttpMixin:
-    def _send_imports_post(self, data):
-        return http.post(url=self._imports_url, 
-                         data=json.dumps(data))
-
-    def _send_nodes_get(self, id):
-        return http.get(url=f'{self._get_nodes_url()}{id}')
-
-    def _send_nodes_delete(self, id):
-        return http.delete(url=f'{self._get_nodes_url()}{id}')
-
-    @classmethod
-    def _get_host(self):
-        host = os.environ.get('WEB_HOST', 'http://127.0.0.1')
-        port = os.environ.get('WEB_PORT', '80')
-        return f'{host}:{port}'
-
-    @classmethod
-    def _get_imports_url(cls):
-        host = cls._get_host()
-        return f'{host}/imports'
-
-    @classmethod
-    def _get_nodes_url(cls):
-        host = cls._get_host()
-        return f'{host}/nodes/'
-
-    @classmethod
-    def _get_delete_url(cls):
-        host = cls._get_host()
-        return f'{host}/delete/'
+from prices_comparator.http_client import HttpMixin
+from prices_comparator.import_forms import ImportForm, ImportValidator
+from prices_comparator.management.commands.loadtest import (
+    Command as LoadTestCommand, _Client as LoadTestClient
+)
+from prices_comparator.models import ImportModel, PriceHistoryModel
+from prices_comparator.node_serializer import NodeSerializer
+from prices_comparator.price_history import HISTORY_TABLE, get_partition_name
+from prices_comparator.nodes_cache import CachedNode, NodesCache, get_nodes_cache
+from prices_comparator.pooled_postgresql.pool import ConnectionPool, PoolTimeout
+from prices_comparator.synthetic_catalog import generate_catalog
+from prices_comparator.views import AsyncPricesComparatorView, PricesComparatorView, SalesView
+from ybs_task.urls import get_urlpatterns
 
 
 class TestCommonMixin:
@@ -76,6 +75,30 @@ class TestCommonMixin:
             json.loads(resp.content.decode()), self._item_not_found
         )
 
+    def _post(self, items, update_date=DATE_TIME_WITH_TZ):
+        ''' the callbacks on commit, the invalidation of the cache, run as after a commit '''
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(
+                '/imports', content_type='application/json',
+                data={'updateDate': update_date, 'items': items}
+            )
+        self.assertEqual(resp.status_code, 200)
+
+    @staticmethod
+    def _category(category_id, parent_id=None, name='category'):
+        return {
+            'id': category_id, 'name': name, 'parentId': parent_id,
+            'type': ItemType.CATEGORY.value,
+        }
+
+    @staticmethod
+    def _offer(offer_id, price, parent_id=None, name='offer'):
+        return {
+            'id': offer_id, 'name': name, 'parentId': parent_id,
+            'type': ItemType.OFFER.value, 'price': price,
+        }
+
 
 class ImportTest(TestCase, HttpMixin, TestCommonMixin):
     @classmethod
@@ -688,4 +711,1585 @@ class IntegratedTest(TestCase, HttpMixin, TestCommonMixin):
         self.assertIsNone(saved['parentId'])
 
         self._delete('21111111-1111-1111-1111-111111111111')
-        self._delete('31111111-1111-1111-1111-111111111111')
\ No newline at end of file
+        self._delete('31111111-1111-1111-1111-111111111111')
+
+    def test_reparent_prices(self):
+        data = {
+            'updateDate': self.DATE_TIME_WITH_TZ,
+            'items': [{
+                'id': '41111111-1111-1111-1111-111111111111',
+                'name': 'cars',
+                'type': ItemType.CATEGORY.value,
+                'price': None
+            }, {
+                'id': '41111111-1111-1111-1111-111111111112',
+                'parentId': '41111111-1111-1111-1111-111111111111',
+                'name': 'trucks',
+                'type': ItemType.CATEGORY.value,
+                'price': None
+            }, {
+                'id': '41111111-1111-1111-1111-111111111113',
+                'parentId': '41111111-1111-1111-1111-111111111112',
+                'name': 'truck',
+                'type': ItemType.OFFER.value,
+                'price': 100,
+            }, {
+                'id': '41111111-1111-1111-1111-111111111114',
+                'parentId': '41111111-1111-1111-1111-111111111111',
+                'name': 'bus',
+                'type': ItemType.OFFER.value,
+                'price': 51,
+            }, {
+                'id': '41111111-1111-1111-1111-111111111115',
+                'name': 'bikes',
+                'type': ItemType.CATEGORY.value,
+                'price': None
+            }]
+        }
+        self._create(data)
+
+        resp = self._send_nodes_get('41111111-1111-1111-1111-111111111111')
+        self.assertEqual(json.loads(resp.content.decode())['price'], 75)
+
+        # move the category with its offer and change the price of the other offer
+        data['items'] = [
+            dict(data['items'][1], parentId='41111111-1111-1111-1111-111111111115'),
+            dict(data['items'][3], price=41),
+        ]
+        self._create(data)
+
+        resp = self._send_nodes_get('41111111-1111-1111-1111-111111111111')
+        self.assertEqual(json.loads(resp.content.decode())['price'], 41)
+        resp = self._send_nodes_get('41111111-1111-1111-1111-111111111115')
+        self.assertEqual(json.loads(resp.content.decode())['price'], 100)
+
+        # a category can't be moved into its own subtree
+        data['items'] = [{
+            'id': '41111111-1111-1111-1111-111111111115',
+            'parentId': '41111111-1111-1111-1111-111111111112',
+            'name': 'bikes',
+            'type': ItemType.CATEGORY.value,
+            'price': None
+        }]
+        resp = self._send_imports_post(data)
+        self.check_validation_failed(resp)
+
+        self._delete('41111111-1111-1111-1111-111111111112')
+        resp = self._send_nodes_get('41111111-1111-1111-1111-111111111115')
+        self.assertIsNone(json.loads(resp.content.decode())['price'])
+
+        self._delete('41111111-1111-1111-1111-111111111111')
+        self._delete('41111111-1111-1111-1111-111111111115')
+
+    def test_deep_chain(self):
+        ids = [f'81111111-1111-1111-1111-{i:012d}' for i in range(40)]
+        items = [{
+            'id': item_id,
+            'name': 'category',
+            'parentId': ids[i - 1] if i else None,
+            'type': ItemType.CATEGORY.value,
+        } for i, item_id in enumerate(ids)]
+        items.append({
+            'id': '81111111-1111-1111-1111-111111111111',
+            'name': 'offer',
+            'parentId': ids[-1],
+            'type': ItemType.OFFER.value,
+            'price': 7,
+        })
+
+        # children go before their parents
+        self._create({'updateDate': self.DATE_TIME_WITH_TZ, 'items': items[::-1]})
+        resp = self._send_nodes_get(ids[0])
+        self.assertEqual(json.loads(resp.content.decode())['price'], 7)
+
+        # a cycle inside the imported set
+        resp = self._send_imports_post({
+            'updateDate': self.DATE_TIME_WITH_TZ,
+            'items': [dict(items[1], parentId=ids[2]), dict(items[2], parentId=ids[1])]
+        })
+        self.check_validation_failed(resp)
+
+        self._delete(ids[0])
+
+
+class ReconcileAggregatesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        date = timezone.now()
+        cls.category = ImportModel.objects.create(
+            id='51111111-1111-1111-1111-111111111111', name='category', date=date,
+            type=ItemType.CATEGORY.value, offers_count=2, price_sum=30,
+            path='/51111111-1111-1111-1111-111111111111/'
+        )
+        for i, price in enumerate((10, 20)):
+            offer_id = f'51111111-1111-1111-1111-11111111111{i + 2}'
+            ImportModel.objects.create(
+                id=offer_id, name='offer', date=date, parent_id=cls.category,
+                type=ItemType.OFFER.value, price=price, offers_count=1,
+                price_sum=price, path=f'{cls.category.path}{offer_id}/'
+            )
+
+    def _reconcile(self, *args):
+        out = io.StringIO()
+        call_command('reconcile_aggregates', *args, stdout=out)
+        return out.getvalue()
+
+    def test_consistent(self):
+        self.assertIn('are consistent', self._reconcile())
+
+    def test_inconsistent(self):
+        ImportModel.objects.filter(id=self.category.id).update(price_sum=31)
+        with self.assertRaises(CommandError):
+            self._reconcile()
+
+        self.assertIn(str(self.category.id), self._reconcile('--fix'))
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.price_sum, 30)
+        self.assertIn('are consistent', self._reconcile())
+
+    def test_inconsistent_path(self):
+        offer_id = '51111111-1111-1111-1111-111111111112'
+        ImportModel.objects.filter(id=offer_id).update(path=f'/{offer_id}/')
+        with self.assertRaises(CommandError):
+            self._reconcile()
+
+        self._reconcile('--fix')
+        self.assertEqual(
+            ImportModel.objects.get(id=offer_id).path,
+            f'{self.category.path}{offer_id}/'
+        )
+
+
+class JsonStreamTest(SimpleTestCase):
+    def _load(self, text, chunk_size):
+        items = []
+        data = json_stream.load_object(
+            io.BytesIO(text.encode()), {'items': items.append}, chunk_size
+        )
+        return data, items
+
+    def test_parity(self):
+        docs = [
+            {'items': [TestCommonMixin.normal_item] * 3, 'updateDate': '2022-05-28T21:12:01.000Z'},
+            {'updateDate': None, 'items': [], 'other': {'items': [1, 2]}},
+            {'items': 'not a list', 'n': 12345678901234567890, 'f': -1.5e-3, 'b': [True, False, None]},
+            {},
+        ]
+        for doc in docs:
+            for text in (json.dumps(doc), json.dumps(doc, ensure_ascii=False, indent=4)):
+                for chunk_size in (1, 3, 7, 1024):
+                    data, items = self._load(text, chunk_size)
+                    expected = dict(doc)
+                    if isinstance(expected.get('items', None), list):
+                        self.assertEqual(items, expected.pop('items'))
+                    self.assertEqual(data, expected)
+
+    def test_invalid(self):
+        docs = [
+            '', '[]', '"items"', '{"items": [1, 2}', '{"items": [1 2]}',
+            '{"a": 1,}', '{"a" 1}', '{a: 1}', '{"a": 1} {}', '{"a": 12',
+            '{"a": tru}', '{"items": [{"id": "1"]}',
+        ]
+        for text in docs:
+            for chunk_size in (1, 4, 1024):
+                with self.assertRaises(json.JSONDecodeError, msg=text):
+                    self._load(text, chunk_size)
+
+    def test_invalid_utf8(self):
+        with self.assertRaises(UnicodeDecodeError):
+            json_stream.load_object(io.BytesIO(b'{"a": "\xff"}'), {}, 2)
+
+    def test_garbage_isnt_buffered(self):
+        stream = io.BytesIO(b'{"items": [{"id": 1} x, ' + b'x' * 1000000 + b']}')
+        with self.assertRaises(json.JSONDecodeError):
+            json_stream.load_object(stream, {'items': lambda item: None}, 1024)
+        self.assertLess(stream.tell(), 10000)
+
+    def test_limits(self):
+        text = '{"items": ["' + 'x' * 3 * const.IMPORT_MAX_VALUE_LENGTH + '"]}'
+        with self.assertRaisesRegex(json.JSONDecodeError, 'too long'):
+            self._load(text, 64 * 1024)
+
+        text = json.dumps({'items': [TestCommonMixin.normal_item] * 100})
+        with self.assertRaisesRegex(json.JSONDecodeError, 'too large'):
+            json_stream.load_object(io.BytesIO(text.encode()), {'items': list}, 1024, 1000)
+
+        data, items = self._load('{"items": ["' + 'x' * 100000 + '"]}', 1024)
+        self.assertEqual(len(items[0]), 100000)
+
+    @override_settings(IMPORT_MAX_BODY_SIZE=100)
+    def test_body_limit(self):
+        resp = self.client.post(
+            '/imports', content_type='application/json',
+            data={'items': [TestCommonMixin.normal_item] * 10}
+        )
+        self.assertEqual(resp.status_code, 400)
+
+
+class NodesStreamingTest(TestCase, TestCommonMixin):
+    @classmethod
+    def setUpTestData(cls):
+        items = []
+        for i in range(3):
+            category_id = f'61111111-1111-1111-1111-11111111111{i}'
+            items.append({
+                'id': category_id,
+                'name': f'category {i}',
+                'parentId': items[-3]['id'] if i else None,
+                'type': ItemType.CATEGORY.value,
+            })
+            for j in range(2):
+                items.append({
+                    'id': f'61111111-1111-1111-1111-2222222222{i}{j}',
+                    'name': f'offer {i}.{j}',
+                    'parentId': category_id,
+                    'type': ItemType.OFFER.value,
+                    'price': 10 * i + j,
+                })
+        items.append({
+            'id': '61111111-1111-1111-1111-111111111119',
+            'name': 'empty',
+            'parentId': items[0]['id'],
+            'type': ItemType.CATEGORY.value,
+        })
+
+        cls.root_id = items[0]['id']
+        cls.offer_id = items[1]['id']
+        resp = cls.client_class().post(
+            '/imports', content_type='application/json',
+            data={'updateDate': cls.DATE_TIME_WITH_TZ, 'items': items}
+        )
+        assert resp.status_code == 200
+
+    def _get_node(self, node_id):
+        resp = self.client.get(f'/nodes/{node_id}')
+        self.assertEqual(resp.status_code, 200)
+        return b''.join(resp) if resp.streaming else resp.content
+
+    def test_same_output(self):
+        for node_id in (self.root_id, '61111111-1111-1111-1111-111111111119', self.offer_id):
+            with override_settings(NODES_STREAMING_MIN_OFFERS=10 ** 9):
+                expected = self._get_node(node_id)
+            with override_settings(NODES_STREAMING_MIN_OFFERS=0):
+                resp = self.client.get(f'/nodes/{node_id}')
+                self.assertTrue(resp.streaming)
+                self.assertEqual(b''.join(resp), expected)
+
+        root = json.loads(self._get_node(self.root_id))
+        self.assertEqual(root['price'], 10)
+        self.assertEqual(len(root['children']), 4)
+
+    @override_settings(IMPORT_ANCESTORS_CHUNK_SIZE=1)
+    def test_import_by_chunks(self):
+        resp = self.client.post(
+            '/imports', content_type='application/json', data={
+                'updateDate': self.DATE_TIME_WITH_OFFSET,
+                'items': [{
+                    'id': '61111111-1111-1111-1111-222222222221',
+                    'name': 'offer 2.1',
+                    'parentId': '61111111-1111-1111-1111-111111111110',
+                    'type': ItemType.OFFER.value,
+                    'price': 1,
+                }, {
+                    'id': '61111111-1111-1111-1111-222222222220',
+                    'name': 'offer 2.0',
+                    'parentId': '61111111-1111-1111-1111-111111111112',
+                    'type': ItemType.OFFER.value,
+                    'price': 47,
+                }]
+            }
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        root = json.loads(self._get_node(self.root_id))
+        self.assertEqual(root['price'], 11)
+        self.assertEqual(
+            parse_datetime(root['date']), parse_datetime(self.DATE_TIME_WITH_OFFSET)
+        )
+        self.assertEqual(len(root['children']), 5)
+
+    def test_not_found(self):
+        with override_settings(NODES_STREAMING_MIN_OFFERS=0):
+            self.check_item_not_found(
+                self.client.get('/nodes/61111111-1111-1111-1111-111111111118')
+            )
+
+
+class NodesStreamingCursorTest(TransactionTestCase, TestCommonMixin):
+    ''' out of TestCase's transaction the view runs in autocommit like in production '''
+
+    @override_settings(NODES_STREAMING_MIN_OFFERS=0)
+    def test_cursor_isnt_held(self):
+        category_id = '61111111-1111-1111-1111-111111111121'
+        resp = self.client.post(
+            '/imports', content_type='application/json',
+            data={'updateDate': self.DATE_TIME_WITH_TZ, 'items': [{
+                'id': category_id,
+                'name': 'category',
+                'type': ItemType.CATEGORY.value,
+            }]}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.client.get(f'/nodes/{category_id}')
+        chunks = iter(resp)
+        first_chunk = next(chunks)
+
+        # a WITH HOLD cursor would be materialized as a whole by now
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT is_holdable FROM pg_cursors')
+            self.assertEqual(cursor.fetchall(), [(False,)])
+
+        content = first_chunk + b''.join(chunks)
+        resp.close()
+        self.assertEqual(json.loads(content)['id'], category_id)
+        self.assertFalse(connection.in_atomic_block)
+
+
+class ImportValidatorParityTest(SimpleTestCase, TestCommonMixin):
+    category_item = {
+        'id': '3fa85f64-5717-4562-b3fc-2c963f66a333',
+        'name': 'Категория',
+        'parentId': None,
+        'type': ItemType.CATEGORY.value,
+        'price': None,
+    }
+
+    field_values = {
+        'id': [
+            None, '', ' ', 'asdew83rnf c', '3FA85F64-5717-4562-B3FC-2C963F66A444',
+            ' 3fa85f64-5717-4562-b3fc-2c963f66a444 ', '3fa85f6457174562b3fc2c963f66a444',
+            '{3fa85f64-5717-4562-b3fc-2c963f66a444}', 123, [], {}, ['x'],
+        ],
+        'name': [None, '', '   ', 'a', ' a ', 'a' * 200, 'a' * 201, ' ' + 'a' * 200 + ' ', 'a\x00', 0, 12, True, []],
+        'parentId': [None, '', '3fa85f64-5717-4562-b3fc-2c963f66a333', '3fa85f64-5717-4562-b3fc-2c963f66a555', 'bad', 1, []],
+        'type': [None, '', 'OFFER', 'CATEGORY', 'offer', ' OFFER', 'GROUP', 1, ['OFFER']],
+        'price': [None, '', 0, -1, 1, '12', ' 12 ', '12.000', 12.0, 12.5, '12.5', '1_000', 1e20, True, 'abc', [], {}],
+    }
+
+    def _validate_forms(self, payload):
+        ''' the forms crash on some payloads, the validator rejects them '''
+
+        form = ImportForm(payload)
+        try:
+            if not form.is_valid():
+                return None
+        except (TypeError, AttributeError):
+            return None
+        field = form.fields['items']
+        return field.local_ids, field.all_ids, form.cleaned_data['updateDate']
+
+    def _validate_fast(self, payload):
+        validator = ImportValidator()
+        data = dict(payload)
+        try:
+            if isinstance(data.get('items', None), list):
+                for item in data.pop('items'):
+                    validator.add_item(item)
+            update_date = validator.validate(data)
+        except ValidationError:
+            return None
+        return validator.local_ids, validator.all_ids, update_date
+
+    def _assert_parity(self, payload):
+        self.assertEqual(
+            self._validate_fast(payload), self._validate_forms(payload), msg=payload
+        )
+
+    def test_item_fields(self):
+        for base_item in (self.normal_item, self.category_item):
+            for field, values in self.field_values.items():
+                for value in values:
+                    item = dict(base_item, **{field: value})
+                    self._assert_parity({'updateDate': self.DATE_TIME_WITH_TZ, 'items': [item]})
+
+                item = dict(base_item)
+                item.pop(field)
+                self._assert_parity({'updateDate': self.DATE_TIME_WITH_TZ, 'items': [item]})
+
+    def test_items(self):
+        offer = dict(self.normal_item, parentId=self.category_item['id'])
+        child_of_offer = dict(offer, id='3fa85f64-5717-4562-b3fc-2c963f66a555', parentId=offer['id'])
+        for items in (
+            None, [], '', 'abc', {}, {'a': 1}, 1,
+            [self.normal_item],
+            [self.category_item, offer],
+            [offer, self.category_item],
+            [offer, offer],
+            [offer, dict(offer, id=offer['id'].upper())],
+            [self.category_item, offer, child_of_offer],
+            [child_of_offer, dict(offer, parentId=None)],
+            [dict(self.category_item, parentId=self.category_item['id'])],
+        ):
+            self._assert_parity({'updateDate': self.DATE_TIME_WITH_TZ, 'items': items})
+
+    def test_update_date(self):
+        for update_date in (
+            None, '', 'asdasd2wef', self.DATE_TIME_WITH_TZ, self.DATE_TIME_WITH_OFFSET,
+            '2022-05-28', '2022-05-28 21:12', 1653772321,
+        ):
+            self._assert_parity({'updateDate': update_date, 'items': [self.normal_item]})
+        self._assert_parity({'items': [self.normal_item]})
+
+    def test_not_object_item(self):
+        for item in ('abc', 1, None, [self.normal_item]):
+            with self.assertRaises(ValidationError):
+                ImportValidator().add_item(item)
+
+
+@override_settings(IMPORT_UPSERT_ENGINE='copy')
+class CopyUpsertTest(TestCase, TestCommonMixin):
+    def test_insert_and_update(self):
+        category = self._category(
+            '71111111-1111-1111-1111-111111111111', name='tab\tnewline\nbackslash\\N'
+        )
+        offer = self._offer('71111111-1111-1111-1111-111111111112', 100, category['id'])
+        self._post([offer, category])
+        self._post([dict(offer, name='Оффер', price=50)], self.DATE_TIME_WITH_OFFSET)
+
+        saved = json.loads(self.client.get(f'/nodes/{category["id"]}').content)
+        self.assertEqual(saved['name'], category['name'])
+        self.assertEqual(saved['price'], 50)
+        self.assertEqual(saved['children'][0]['name'], 'Оффер')
+        self.assertEqual(
+            parse_datetime(saved['date']), parse_datetime(self.DATE_TIME_WITH_OFFSET)
+        )
+
+
+class SortTopologicallyTest(SimpleTestCase):
+    def _sort(self, nodes):
+        return PricesComparatorView._sort_topologically(nodes, lambda node: node['parentId'])
+
+    def test_long_chain(self):
+        nodes = {i: {'id': i, 'parentId': i - 1 if i else None} for i in range(10000)}
+        nodes = dict(reversed(nodes.items()))
+        self.assertEqual([node['id'] for node in self._sort(nodes)], list(range(10000)))
+
+    def test_forest(self):
+        nodes = {
+            'b': {'id': 'b', 'parentId': 'a'},
+            'c': {'id': 'c', 'parentId': 'stored'},
+            'a': {'id': 'a', 'parentId': None},
+            'd': {'id': 'd', 'parentId': 'c'},
+        }
+        ordered = [node['id'] for node in self._sort(nodes)]
+        self.assertCountEqual(ordered, nodes)
+        self.assertLess(ordered.index('a'), ordered.index('b'))
+        self.assertLess(ordered.index('c'), ordered.index('d'))
+
+    def test_cycle(self):
+        nodes = {
+            'a': {'id': 'a', 'parentId': None},
+            'b': {'id': 'b', 'parentId': 'c'},
+            'c': {'id': 'c', 'parentId': 'b'},
+        }
+        with self.assertRaises(IntegrityError):
+            self._sort(nodes)
+
+
+@override_settings(NODES_CACHE_MAX_BYTES=10 ** 6)
+class NodesCacheTest(TestCase, TestCommonMixin):
+    category_id = '91111111-1111-1111-1111-111111111111'
+    subcategory_id = '91111111-1111-1111-1111-111111111112'
+    offer_id = '91111111-1111-1111-1111-111111111113'
+
+    def _get_price(self, node_id):
+        return json.loads(self.client.get(f'/nodes/{node_id}').content)['price']
+
+    def test_invalidation(self):
+        self._post([
+            self._category(self.category_id),
+            self._category(self.subcategory_id, self.category_id, 'subcategory'),
+            self._offer(self.offer_id, 10, self.subcategory_id),
+        ])
+
+        self.assertEqual(self._get_price(self.category_id), 10)
+        self.assertEqual(self._get_price(self.category_id), 10)
+        self.assertEqual(self._get_price(self.offer_id), 10)
+        stats = json.loads(self.client.get('/stats/cache').content)
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 2, 2))
+
+        # the ancestors of the changed offer are invalidated
+        self._post([self._offer(self.offer_id, 20, self.subcategory_id)])
+        self.assertEqual(self._get_price(self.category_id), 20)
+        self.assertEqual(self._get_price(self.offer_id), 20)
+
+        # the deleted subtree and its ancestors are invalidated
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/nodes/{self.subcategory_id}')
+        self.assertIsNone(self._get_price(self.category_id))
+        self.check_item_not_found(self.client.get(f'/nodes/{self.offer_id}'))
+
+        stats = get_nodes_cache().stats()
+        self.assertEqual((stats['hits'], stats['invalidations']), (1, 9))
+
+
+class NodesCacheLruTest(SimpleTestCase):
+    ids = [f'a1111111-1111-1111-1111-11111111111{i}' for i in range(4)]
+    entry = CachedNode('abcd', '"1"', 0)
+
+    def test_eviction(self):
+        cache = NodesCache(max_bytes=10)
+        for node_id in self.ids[:3]:
+            cache.set(node_id, self.entry)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get(self.ids[0], '"1"'))
+
+        # the recently read entry stays
+        self.assertEqual(cache.get(self.ids[1], '"1"'), self.entry)
+        cache.set(self.ids[3], self.entry)
+        self.assertEqual(cache.get(self.ids[1], '"1"'), self.entry)
+        self.assertIsNone(cache.get(self.ids[2], '"1"'))
+
+        # too big responses aren't cached
+        cache.set(self.ids[0], CachedNode('a' * 11, '"1"', 0))
+        self.assertIsNone(cache.get(self.ids[0], '"1"'))
+
+    def test_other_version(self):
+        # a response read along with a change is set after the version changed
+        cache = NodesCache(max_bytes=10)
+        cache.set(self.ids[0], self.entry)
+        self.assertIsNone(cache.get(self.ids[0], '"2"'))
+        self.assertEqual(cache.misses, 1)
+
+
+class ConditionalGetTest(TestCase, TestCommonMixin):
+    category = TestCommonMixin._category('b1111111-1111-1111-1111-111111111111')
+    offer = TestCommonMixin._offer(
+        'b1111111-1111-1111-1111-111111111112', 10, 'b1111111-1111-1111-1111-111111111111'
+    )
+
+    def _get(self, node_id, **headers):
+        return self.client.get(f'/nodes/{node_id}', **headers)
+
+    @staticmethod
+    def _get_json(resp):
+        return json.loads(b''.join(resp) if resp.streaming else resp.content)
+
+    def _check_etags(self):
+        resp = self._get(self.category['id'])
+        self.assertEqual(resp.status_code, 200)
+        etag = resp['ETag']
+
+        resp = self._get(self.category['id'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+        self.assertEqual(resp.content, b'')
+
+        last_modified = resp['Last-Modified']
+
+        # the subtree changes, likely in the same second
+        self._post([dict(self.offer, price=20)])
+        resp = self._get(self.category['id'], HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self._get_json(resp)['price'], 20)
+
+        # If-None-Match takes precedence
+        resp = self._get(
+            self.category['id'], HTTP_IF_NONE_MATCH=etag, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self._get_json(resp)['price'], 20)
+        self.assertNotEqual(resp['ETag'], etag)
+        etag = resp['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/nodes/{self.offer["id"]}')
+        resp = self._get(self.category['id'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNone(self._get_json(resp)['price'])
+
+    def test_etag(self):
+        self._post([self.category, self.offer])
+        self._check_etags()
+
+    @override_settings(NODES_STREAMING_MIN_OFFERS=0)
+    def test_etag_streaming(self):
+        self._post([self.category, self.offer])
+        self._check_etags()
+
+    @override_settings(NODES_CACHE_MAX_BYTES=10 ** 6)
+    def test_etag_cached(self):
+        self._post([self.category, self.offer])
+        self._check_etags()
+
+
+class AsyncUrls:
+    urlpatterns = get_urlpatterns(AsyncPricesComparatorView)
+
+
+@override_settings(ROOT_URLCONF=AsyncUrls)
+class AsyncViewsTest(TransactionTestCase, TestCommonMixin):
+    ''' the async views use connections of their threads,
+    so the changes have to be committed to be seen '''
+
+    category_id = 'b1111111-1111-1111-1111-111111111111'
+    offer_id = 'b1111111-1111-1111-1111-111111111112'
+
+    async def test_views(self):
+        resp = await self.async_client.post(
+            '/imports', content_type='application/json',
+            data={'updateDate': self.DATE_TIME_WITH_TZ, 'items': [{
+                'id': self.category_id,
+                'name': 'category',
+                'type': ItemType.CATEGORY.value,
+            }, {
+                'id': self.offer_id,
+                'name': 'offer',
+                'parentId': self.category_id,
+                'type': ItemType.OFFER.value,
+                'price': 10,
+            }]}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        resp = await self.async_client.get(f'/nodes/{self.category_id}')
+        self.assertEqual(json.loads(resp.content)['children'][0]['price'], 10)
+
+        resp = await self.async_client.delete(f'/delete/{self.category_id}')
+        self.assertEqual(resp.status_code, 200)
+        self.check_item_not_found(await self.async_client.get(f'/nodes/{self.offer_id}'))
+
+    @override_settings(NODES_STREAMING_MIN_OFFERS=0)
+    async def test_streamed(self):
+        ''' the stream is async, so the server sends the chunks as they're made,
+        and the middleware stays in the event loop '''
+
+        await self.async_client.post(
+            '/imports', content_type='application/json',
+            data={'updateDate': self.DATE_TIME_WITH_TZ, 'items': [{
+                'id': self.category_id,
+                'name': 'category',
+                'type': ItemType.CATEGORY.value,
+            }]}
+        )
+
+        with tempfile.TemporaryDirectory() as profiling_dir:
+            with override_settings(PROFILING_DIR=profiling_dir, PROFILING_SAMPLE_RATE=0):
+                resp = await AsyncClient().get(
+                    f'/nodes/{self.category_id}', headers={'X-Profile': '1'}
+                )
+                self.assertTrue(resp.is_async)
+                content = b''.join([chunk async for chunk in resp.streaming_content])
+                self.assertEqual(json.loads(content)['id'], self.category_id)
+
+            with open(os.path.join(profiling_dir, 'requests.jsonl')) as f:
+                record = json.loads(f.readline())
+            self.assertGreater(record['sqlQueries'], 0)
+            # the node and the subtree streamed
+            self.assertEqual(record['rows'], 2)
+            self.assertTrue(os.path.exists(record['profile']))
+
+    async def test_same_as_sync(self):
+        ''' the subtree read by asyncpg is serialized as the one read by psycopg2,
+        buffered, streamed and streamed by a row at a time '''
+
+        sub_category_id = 'b1111111-1111-1111-1111-111111111113'
+        await self.async_client.post(
+            '/imports', content_type='application/json',
+            data={'updateDate': self.DATE_TIME_WITH_TZ, 'items': [{
+                'id': self.category_id,
+                'name': 'category',
+                'type': ItemType.CATEGORY.value,
+            }, {
+                'id': sub_category_id,
+                'name': 'sub category',
+                'parentId': self.category_id,
+                'type': ItemType.CATEGORY.value,
+            }, {
+                'id': self.offer_id,
+                'name': 'offer',
+                'parentId': sub_category_id,
+                'type': ItemType.OFFER.value,
+                'price': 10,
+            }]}
+        )
+        with override_settings(ROOT_URLCONF='ybs_task.urls'):
+            expected = await sync_to_async(
+                lambda: self.client.get(f'/nodes/{self.category_id}').content
+            )()
+
+        resp = await self.async_client.get(f'/nodes/{self.category_id}')
+        self.assertEqual(resp.content, expected)
+
+        with override_settings(NODES_STREAMING_MIN_OFFERS=0):
+            resp = await AsyncClient().get(f'/nodes/{self.category_id}')
+            content = b''.join([chunk async for chunk in resp.streaming_content])
+            self.assertEqual(content, expected)
+
+        path = await sync_to_async(lambda: ImportModel.objects.get(id=self.category_id).path)()
+        chunks = [chunk async for chunk in AsyncPricesComparatorView()._aiter_node_json(path, 1)]
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(''.join(chunks).encode(), expected)
+
+        resp = await self.async_client.get(
+            f'/nodes/{self.category_id}', headers={'If-None-Match': resp['ETag']}
+        )
+        self.assertEqual(resp.status_code, 304)
+        self.check_item_not_found(
+            await self.async_client.get('/nodes/b1111111-1111-1111-1111-111111111119')
+        )
+
+    @override_settings(ASYNC_DB_POOL_MAX_SIZE=2)
+    async def test_pool(self):
+        ''' the requests of a loop share the connections of its pool '''
+
+        try:
+            async def get_backend_pid():
+                async with async_db.acquire() as db:
+                    pid = await db.fetchval('SELECT pg_backend_pid()')
+                    await asyncio.sleep(0.01)
+                    return pid
+
+            pids = await asyncio.gather(*(get_backend_pid() for __ in range(6)))
+            self.assertEqual(len(set(pids)), 2)
+        finally:
+            await async_db.close_pool()
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql):
+        self.connection.queries.append(sql)
+
+
+class FakeConnection:
+    def __init__(self, healthy=True):
+        self.closed = 0
+        self.healthy = healthy
+        self.in_transaction = False
+        self.autocommit = False
+        self.queries = []
+
+    def get_transaction_status(self):
+        return 2 if self.in_transaction else 0
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+    def cursor(self):
+        if not self.healthy:
+            raise PoolTimeout('connection is broken')
+        return FakeCursor(self)
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def _get_pool(self, **options):
+        options = {'min_size': 0, 'max_size': 2, 'timeout': 1, 'check_idle': 30, 'max_idle': 600,
+                   **options}
+        return ConnectionPool(**options)
+
+    def test_reuse(self):
+        pool = self._get_pool()
+        connection = pool.acquire(FakeConnection)
+        connection.in_transaction = True
+        pool.release(connection)
+
+        self.assertFalse(connection.in_transaction)
+        self.assertIs(pool.acquire(FakeConnection), connection)
+        stats = pool.stats()
+        self.assertEqual((stats['acquires'], stats['connects'], stats['inUse']), (2, 1, 1))
+
+    def test_reset(self):
+        pool = self._get_pool()
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+        self.assertTrue(connection.autocommit)
+        self.assertEqual(connection.queries, ['DISCARD ALL'])
+
+    def test_broken(self):
+        pool = self._get_pool(check_idle=0)
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+        # broken while it's idle
+        connection.healthy = False
+        self.assertIsNot(pool.acquire(FakeConnection), connection)
+        self.assertTrue(connection.closed)
+
+        connection = pool.acquire(FakeConnection)
+        connection.close()
+        pool.release(connection)
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['healthCheckFailures']), (1, 1))
+
+        # broken before it's released
+        connection = pool.acquire(lambda: FakeConnection(healthy=False))
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_timeout(self):
+        pool = self._get_pool(max_size=1, timeout=0.01)
+        pool.acquire(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiting(self):
+        pool = self._get_pool(max_size=1)
+        connection = pool.acquire(FakeConnection)
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(pool.acquire(FakeConnection)))
+        thread.start()
+        while not pool.stats()['waiting']:
+            pass
+        pool.release(connection)
+        thread.join()
+        self.assertEqual(acquired, [connection])
+
+    def test_max_idle(self):
+        pool = self._get_pool(min_size=1, max_size=3, max_idle=0)
+        connections = [pool.acquire(FakeConnection) for __ in range(3)]
+        for connection in connections:
+            pool.release(connection)
+
+        pool.acquire(FakeConnection)
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(sum(c.closed for c in connections), 2)
+
+
+class DbPoolStatsTest(TestCase):
+    def test_stats(self):
+        stats = json.loads(self.client.get('/stats/db').content)
+        self.assertEqual(stats['default']['inUse'], 1)
+
+
+class SyntheticCatalogTest(TestCase):
+    def test_generate_catalog(self):
+        items, levels = generate_catalog(size=100, depth=3, fanout=5, offer_ratio=0.4, seed=1)
+
+        self.assertEqual(len(items), 1 + 5 + 5 * len(levels[1]))
+        self.assertEqual(len(levels), 2)
+        self.assertEqual(items, generate_catalog(100, 3, 5, 0.4, seed=1)[0])
+
+        categories = {i['id'] for i in items if i['type'] == ItemType.CATEGORY.value}
+        self.assertEqual(categories, set(levels[0] + levels[1]))
+        self.assertTrue(all(i['parentId'] in categories for i in items[1:]))
+
+    def test_benchmark(self):
+        out = io.StringIO()
+        call_command('benchmark', size=50, repeat=1, reads=2, stdout=out)
+        self.assertIn('delete_root', out.getvalue())
+        self.assertFalse(ImportModel.objects.exists())
+
+
+class LoadTestReportTest(SimpleTestCase):
+    def test_report(self):
+        latencies = {'imports': [], 'nodes': [i / 1000 for i in range(100, 0, -1)], 'delete': [3]}
+        report = LoadTestCommand()._get_report(latencies, {'imports': 0, 'nodes': 5, 'delete': 0}, 10)
+
+        nodes = report['operations']['nodes']
+        self.assertEqual((nodes['p50'], nodes['p95'], nodes['p99']), (50, 95, 99))
+        self.assertEqual((nodes['errorRate'], nodes['throughput']), (0.05, 10))
+        self.assertEqual(sum(b['count'] for b in nodes['histogram']), 100)
+        self.assertNotIn('imports', report['operations'])
+        self.assertEqual(report['operations']['delete']['histogram'][-2]['count'], 1)
+
+    def test_delete_url(self):
+        client = LoadTestClient('http://host:8080')
+        client._http = unittest.mock.Mock()
+        client._send_delete('e1')
+        client._http.delete.assert_called_once_with(url='http://host:8080/delete/e1')
+
+
+class ProfilingMiddlewareTest(TestCase, TestCommonMixin):
+    def test_profiling(self):
+        with tempfile.TemporaryDirectory() as profiling_dir:
+            with override_settings(PROFILING_DIR=profiling_dir, PROFILING_SAMPLE_RATE=0):
+                self.client.post(
+                    '/imports', content_type='application/json',
+                    data={'updateDate': self.DATE_TIME_WITH_TZ, 'items': [{
+                        'id': 'c1111111-1111-1111-1111-111111111111',
+                        'name': 'category',
+                        'type': ItemType.CATEGORY.value,
+                    }]}
+                )
+                self.client.get(
+                    '/nodes/c1111111-1111-1111-1111-111111111111', HTTP_X_PROFILE='1'
+                )
+
+            with open(os.path.join(profiling_dir, 'requests.jsonl')) as f:
+                post, get = [json.loads(line) for line in f]
+
+            self.assertEqual((post['method'], post['status']), ('POST', 200))
+            self.assertNotIn('profile', post)
+            self.assertGreater(post['sqlQueries'], 0)
+
+            self.assertEqual(get['path'], '/nodes/c1111111-1111-1111-1111-111111111111')
+            self.assertGreater(get['rows'], 0)
+            self.assertTrue(os.path.exists(get['profile']))
+
+    @override_settings(NODES_STREAMING_MIN_OFFERS=0)
+    def test_streamed(self):
+        ''' the rows fetched by the stream are counted, the line is written at its end '''
+
+        category_id = 'c1111111-1111-1111-1111-111111111111'
+        self._post([self._category(category_id)] + [
+            self._offer(f'c1111111-1111-1111-1111-11111111112{i}', i, category_id) for i in range(3)
+        ])
+
+        with tempfile.TemporaryDirectory() as profiling_dir:
+            requests_path = os.path.join(profiling_dir, 'requests.jsonl')
+            with override_settings(PROFILING_DIR=profiling_dir, PROFILING_SAMPLE_RATE=0):
+                # the middleware of self.client is loaded by the import without PROFILING_DIR
+                client = Client()
+                for path, params in ((f'/nodes/{category_id}', {}), ('/sales', {'date': self.DATE_TIME_WITH_TZ})):
+                    resp = client.get(path, params)
+                    self.assertTrue(resp.streaming)
+                    self.assertFalse(os.path.exists(requests_path))
+                    # the client closes the response at the end
+                    b''.join(resp)
+
+                    with open(requests_path) as f:
+                        record = json.loads(f.readlines()[-1])
+                    os.remove(requests_path)
+                    self.assertEqual(record['path'], path)
+                    # the node read first, then the subtree of 4 nodes or the 3 offers
+                    self.assertEqual(record['rows'], 5 if params == {} else 3)
+
+
+class MetricsTest(TestCase, TestCommonMixin):
+    def test_metrics(self):
+        self.client.post(
+            '/imports', content_type='application/json',
+            data={'updateDate': self.DATE_TIME_WITH_TZ, 'items': [{
+                'id': 'd1111111-1111-1111-1111-111111111111',
+                'name': 'category',
+                'type': ItemType.CATEGORY.value,
+            }]}
+        )
+        self.client.get('/nodes/d1111111-1111-1111-1111-111111111111')
+
+        resp = self.client.get('/metrics')
+        self.assertTrue(resp['Content-Type'].startswith('text/plain; version=0.0.4'))
+        content = resp.content.decode()
+        for line in (
+            'prices_comparator_requests_total{method="POST",route="imports",status="200"}',
+            'prices_comparator_phase_seconds_count{endpoint="imports",phase="upsert"}',
+            'prices_comparator_phase_seconds_count{endpoint="nodes",phase="serialize"}',
+            'prices_comparator_subtree_size_bucket{le="1.0"}',
+            'prices_comparator_import_batch_size_count',
+        ):
+            self.assertIn(line, content)
+
+    @override_settings(NODES_STREAMING_MIN_OFFERS=0)
+    def test_streamed_phases(self):
+        self.client.post(
+            '/imports', content_type='application/json',
+            data={'updateDate': self.DATE_TIME_WITH_TZ, 'items': [{
+                'id': 'd1111111-1111-1111-1111-111111111111',
+                'name': 'category',
+                'type': ItemType.CATEGORY.value,
+            }]}
+        )
+        labels = {'endpoint': 'nodes', 'phase': 'serialize'}
+        before = REGISTRY.get_sample_value('prices_comparator_phase_seconds_count', labels) or 0
+
+        resp = self.client.get('/nodes/d1111111-1111-1111-1111-111111111111')
+        self.assertTrue(resp.streaming)
+        b''.join(resp)
+        resp.close()
+        self.assertEqual(
+            REGISTRY.get_sample_value('prices_comparator_phase_seconds_count', labels), before + 1
+        )
+
+    def test_import_phases(self):
+        ''' the items are validated as they're parsed, the time goes to validate '''
+
+        def get_sum(phase):
+            labels = {'endpoint': 'imports', 'phase': phase}
+            return REGISTRY.get_sample_value('prices_comparator_phase_seconds_sum', labels) or 0
+
+        add_item = ImportValidator.add_item
+
+        def slow_add_item(validator, item):
+            time.sleep(0.05)
+            return add_item(validator, item)
+
+        before = {phase: get_sum(phase) for phase in ('parse', 'validate', 'version')}
+        with unittest.mock.patch.object(ImportValidator, 'add_item', slow_add_item):
+            resp = self.client.post(
+                '/imports', content_type='application/json',
+                data={'updateDate': self.DATE_TIME_WITH_TZ, 'items': [{
+                    'id': 'd1111111-1111-1111-1111-111111111111',
+                    'name': 'category',
+                    'type': ItemType.CATEGORY.value,
+                }]}
+            )
+        self.assertEqual(resp.status_code, 200)
+
+        self.assertLess(get_sum('parse') - before['parse'], 0.05)
+        self.assertGreaterEqual(get_sum('validate') - before['validate'], 0.05)
+        self.assertGreater(get_sum('version'), before['version'])
+
+    def test_multiprocess(self):
+        ''' the processes write to files of the directory, any of them reports the sums '''
+
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            env = dict(os.environ, **{metrics.MULTIPROC_DIR_ENV: metrics_dir})
+            script = (
+                'from prices_comparator import metrics; '
+                'metrics.IMPORT_ROWS.labels(result="written").inc(2); '
+                'print(metrics.render_metrics().decode())'
+            )
+            for __ in range(2):
+                output = subprocess.run(
+                    [sys.executable, '-c', script], env=env, check=True,
+                    capture_output=True, text=True
+                ).stdout
+
+        self.assertIn('prices_comparator_import_rows_total{result="written"} 4.0', output)
+
+
+class DeleteSubtreeTest(TestCase):
+    def test_delete_subtree(self):
+        items, levels = generate_catalog(size=300, depth=4, fanout=4, offer_ratio=0.3, seed=2)
+        resp = self.client.post(
+            '/imports', content_type='application/json',
+            data={'updateDate': '2022-06-01T00:00:00.000Z', 'items': items}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        node = ImportModel.objects.get(id=levels[1][0])
+        subtree_size = ImportModel.objects.filter(path__startswith=node.path).count()
+        self.assertGreater(subtree_size, 1)
+
+        self.assertEqual(self.client.delete(f'/delete/{node.id}').status_code, 200)
+        self.assertEqual(ImportModel.objects.count(), len(items) - subtree_size)
+        self.assertFalse(ImportModel.objects.filter(path__startswith=node.path).exists())
+        call_command('reconcile_aggregates', stdout=io.StringIO())
+
+    def test_empty_path(self):
+        ''' the range of an empty path is the whole table '''
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ImportModel.objects.create(
+                id='e1111111-1111-1111-1111-111111111111', name='category',
+                date=timezone.now(), type=ItemType.CATEGORY.value
+            )
+
+        for query in (
+            lambda: PricesComparatorView._delete_subtree('', returning_ids=True),
+            lambda: PricesComparatorView()._get_node_children(''),
+        ):
+            with self.assertRaises(InternalError), transaction.atomic():
+                query()
+
+
+class NodeSerializerTest(SimpleTestCase):
+    date = parse_datetime('2022-05-28T21:12:01.123456+00:00')
+
+    def _row(self, id, name, parent_id, type, price, path, offers_count=0, price_sum=0):
+        return (id, name, self.date, parent_id, type, price, offers_count, price_sum, path)
+
+    def _dumps(self, rows):
+        return ''.join(NodeSerializer().iter_subtree(rows))
+
+    def test_parity(self):
+        rows = [
+            self._row('e1', 'Кат "1"\n\\', None, ItemType.CATEGORY.value, None, '/e1/', 2, 301),
+            self._row('e2', '', 'e1', ItemType.CATEGORY.value, None, '/e1/e2/'),
+            self._row('e3', 'оффер \U0001f600', 'e1', ItemType.OFFER.value, 150, '/e1/e3/'),
+        ]
+
+        expected = {
+            'id': 'e1', 'name': 'Кат "1"\n\\', 'date': '2022-05-28T21:12:01.123Z',
+            'type': ItemType.CATEGORY.value, 'price': 150, 'parentId': None, 'children': [{
+                'id': 'e2', 'name': '', 'date': '2022-05-28T21:12:01.123Z',
+                'type': ItemType.CATEGORY.value, 'price': None, 'parentId': 'e1', 'children': [],
+            }, {
+                'id': 'e3', 'name': 'оффер \U0001f600', 'date': '2022-05-28T21:12:01.123Z',
+                'type': ItemType.OFFER.value, 'price': 150, 'parentId': 'e1', 'children': None,
+            }],
+        }
+        self.assertEqual(self._dumps(rows), json.dumps(expected))
+        self.assertEqual(self._dumps(rows[2:]), json.dumps(expected['children'][1]))
+
+    def test_deep(self):
+        rows, path = [], '/'
+        for i in range(10000):
+            path += f'e{i}/'
+            rows.append(self._row(f'e{i}', 'c', f'e{i - 1}', ItemType.CATEGORY.value, None, path))
+
+        content = self._dumps(rows)
+        self.assertEqual(content.count('"children": ['), 10000)
+        self.assertTrue(content.endswith('[' + ']}' * 10000))
+
+
+class NodesPageTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.items, cls.levels = generate_catalog(
+            size=200, depth=4, fanout=5, offer_ratio=0.2, seed=3
+        )
+        cls.root_id = cls.levels[0][0]
+
+    def setUp(self):
+        resp = self.client.post(
+            '/imports', content_type='application/json',
+            data={'updateDate': '2022-06-01T00:00:00.000Z', 'items': self.items}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def _get(self, node_id, **params):
+        resp = self.client.get(f'/nodes/{node_id}', params)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(b''.join(resp) if resp.streaming else resp.content)
+
+    def _strip(self, node, depth):
+        ''' the full subtree cut like the page of the given depth '''
+
+        if node['children'] is None:
+            return node
+        node = dict(node, nextCursor=None)
+        if depth == 0:
+            node['children'] = None
+        else:
+            node['children'] = [self._strip(child, depth - 1) for child in node['children']]
+        return node
+
+    def test_depth(self):
+        full = self._get(self.root_id)
+        for depth in range(5):
+            self.assertEqual(self._get(self.root_id, depth=depth), self._strip(full, depth))
+
+    def test_pages(self):
+        full = self._get(self.root_id)
+        children_ids = sorted(child['id'] for child in full['children'])
+        self.assertGreater(len(children_ids), 2)
+
+        seen_ids, after = [], None
+        while True:
+            params = {'depth': 1, 'limit': 2}
+            if after:
+                params['after'] = after
+            page = self._get(self.root_id, **params)
+            self.assertEqual(page['price'], full['price'])
+            seen_ids.extend(child['id'] for child in page['children'])
+            after = page['nextCursor']
+            if after is None:
+                break
+            self.assertEqual(after, seen_ids[-1])
+        self.assertEqual(seen_ids, children_ids)
+
+        # every category of the level has its own page
+        page = self._get(self.root_id, depth=2, limit=1)
+        for child in page['children']:
+            if child['children']:
+                self.assertEqual(len(child['children']), 1)
+
+    def test_offer(self):
+        offer = next(item for item in self.items if item['type'] == ItemType.OFFER.value)
+        self.assertEqual(self._get(offer['id'], depth=0), self._get(offer['id']))
+
+    def test_bad_params(self):
+        for params in ({'depth': -1}, {'limit': 0}, {'limit': 'x'}, {'after': 'x'}):
+            resp = self.client.get(f'/nodes/{self.root_id}', params)
+            self.assertEqual(resp.status_code, 400)
+
+
+class PriceHistoryTest(TestCase, TestCommonMixin):
+    category_id = 'c1111111-1111-1111-1111-111111111111'
+    offer_ids = ('c1111111-1111-1111-1111-111111111112', 'c1111111-1111-1111-1111-111111111113')
+
+    def _get_statistic(self, node_id, **params):
+        resp = self.client.get(f'/node/{node_id}/statistic', params)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(resp.content)['items']
+
+    def setUp(self):
+        self._post([
+            self._category(self.category_id),
+            self._offer(self.offer_ids[0], 100, self.category_id),
+        ], '2022-05-31T23:00:00.000Z')
+        self._post([self._offer(self.offer_ids[1], 301, self.category_id)], '2022-06-01T00:00:00.000Z')
+        self._post([self._offer(self.offer_ids[0], 200, self.category_id)], '2022-06-02T00:00:00.000Z')
+
+    def test_statistic(self):
+        items = self._get_statistic(self.category_id)
+        self.assertEqual([(i['date'], i['price']) for i in items], [
+            ('2022-05-31T23:00:00.000Z', 100),
+            ('2022-06-01T00:00:00.000Z', 200),
+            ('2022-06-02T00:00:00.000Z', 250),
+        ])
+        self.assertEqual(items[0], {
+            'id': self.category_id, 'name': 'category', 'date': '2022-05-31T23:00:00.000Z',
+            'type': ItemType.CATEGORY.value, 'price': 100, 'parentId': None,
+        })
+
+        items = self._get_statistic(
+            self.offer_ids[0], dateStart='2022-06-01T00:00:00.000Z', dateEnd='2022-06-02T00:00:00.000Z'
+        )
+        self.assertEqual(items, [])
+        items = self._get_statistic(self.offer_ids[0], dateStart='2022-06-01T00:00:00.000Z')
+        self.assertEqual([i['price'] for i in items], [200])
+
+    def test_partitions(self):
+        for name in ('2022-05', '2022-06'):
+            date = parse_datetime(f'{name}-15T00:00:00Z')
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT to_regclass(%s)', [get_partition_name(date)])
+                self.assertIsNotNone(cursor.fetchone()[0])
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'EXPLAIN SELECT * FROM {HISTORY_TABLE} WHERE node_id = %s AND date >= %s',
+                [self.category_id, '2022-06-01T00:00:00Z']
+            )
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('_p202206', plan)
+        self.assertNotIn('_p202205', plan)
+
+    def test_errors(self):
+        resp = self.client.get(f'/node/{self.category_id}/statistic', {'dateStart': 'x'})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get(f'/node/{self.category_id}/statistic', {
+            'dateStart': '2022-06-02T00:00:00.000Z', 'dateEnd': '2022-06-01T00:00:00.000Z'
+        })
+        self.assertEqual(resp.status_code, 400)
+
+        self.assertEqual(self.client.delete(f'/delete/{self.category_id}').status_code, 200)
+        resp = self.client.get(f'/node/{self.category_id}/statistic')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_delete(self):
+        ''' the ancestors get the prices left as of the deletion '''
+
+        started = timezone.now()
+        self.assertEqual(self.client.delete(f'/delete/{self.offer_ids[1]}').status_code, 200)
+
+        items = self._get_statistic(self.category_id)
+        self.assertEqual([i['price'] for i in items], [100, 200, 250, 200])
+        self.assertGreaterEqual(parse_datetime(items[-1]['date']), started.replace(microsecond=0))
+
+    def test_command(self):
+        call_command('create_history_partitions', '--months', '3')
+
+        date = timezone.now()
+        with connection.cursor() as cursor:
+            for __ in range(3):
+                cursor.execute('SELECT to_regclass(%s)', [get_partition_name(date)])
+                self.assertIsNotNone(cursor.fetchone()[0])
+                date = (date.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+class PriceHistoryPartitionTest(TransactionTestCase, TestCommonMixin):
+    def test_own_transaction(self):
+        ''' the partition is committed before the import, it stays after its rollback '''
+
+        update_date = '2031-03-01T00:00:00.000Z'
+        with unittest.mock.patch('prices_comparator.views.upsert_models', side_effect=IntegrityError):
+            resp = self.client.post(
+                '/imports', content_type='application/json',
+                data={'updateDate': update_date, 'items': [{
+                    'id': 'c1111111-1111-1111-1111-111111111121',
+                    'name': 'category',
+                    'type': ItemType.CATEGORY.value,
+                }]}
+            )
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(ImportModel.objects.exists())
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [get_partition_name(parse_datetime(update_date))])
+            self.assertIsNotNone(cursor.fetchone()[0])
+
+
+class SalesTest(TestCase, TestCommonMixin):
+    category_id = 'd1111111-1111-1111-1111-111111111111'
+
+    def _sales_offer(self, number, price):
+        return self._offer(
+            f'd1111111-1111-1111-1111-11111111111{number}', price, self.category_id, f'offer {number}'
+        )
+
+    def _get_sales(self, date):
+        resp = self.client.get('/sales', {'date': date})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        return json.loads(b''.join(resp))['items']
+
+    def setUp(self):
+        self._post([
+            self._category(self.category_id), self._sales_offer(2, 100),
+        ], '2022-06-01T00:00:00.000Z')
+        self._post([self._sales_offer(3, 200)], '2022-06-01T12:00:00.000Z')
+
+    def test_sales(self):
+        items = self._get_sales('2022-06-02T00:00:00.000Z')
+        self.assertEqual(items, [{
+            'id': 'd1111111-1111-1111-1111-111111111112', 'name': 'offer 2',
+            'date': '2022-06-01T00:00:00.000Z', 'type': ItemType.OFFER.value, 'price': 100,
+            'parentId': self.category_id,
+        }, {
+            'id': 'd1111111-1111-1111-1111-111111111113', 'name': 'offer 3',
+            'date': '2022-06-01T12:00:00.000Z', 'type': ItemType.OFFER.value, 'price': 200,
+            'parentId': self.category_id,
+        }])
+
+        items = self._get_sales('2022-06-02T00:00:00.001Z')
+        self.assertEqual([i['name'] for i in items], ['offer 3'])
+        self.assertEqual(self._get_sales('2022-05-31T23:59:59.999Z'), [])
+
+    def test_index_only(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + SalesView._sales_sql, {
+                'type': ItemType.OFFER.value,
+                'date_start': '2022-06-01T00:00:00Z', 'date_end': '2022-06-02T00:00:00Z',
+            })
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('Index Only Scan using importmodel_offer_date_idx', plan)
+
+    def test_bad_date(self):
+        self.assertEqual(self.client.get('/sales').status_code, 400)
+        self.assertEqual(self.client.get('/sales', {'date': 'x'}).status_code, 400)
+
+
+class SalesStreamingTest(TransactionTestCase, TestCommonMixin):
+    ''' the stream is read in autocommit as in production '''
+
+    offer_id = 'd1111111-1111-1111-1111-111111111121'
+
+    def setUp(self):
+        resp = self.client.post(
+            '/imports', content_type='application/json',
+            data={'updateDate': self.DATE_TIME_WITH_TZ, 'items': [self._offer(self.offer_id, 10)]}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_cursor_isnt_held(self):
+        resp = self.client.get('/sales', {'date': self.DATE_TIME_WITH_TZ})
+        chunks = iter(resp)
+        first_chunk = next(chunks)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT is_holdable FROM pg_cursors')
+            self.assertEqual(cursor.fetchall(), [(False,)])
+
+        content = first_chunk + b''.join(chunks)
+        resp.close()
+        self.assertEqual(json.loads(content)['items'][0]['id'], self.offer_id)
+        self.assertFalse(connection.in_atomic_block)
+
+    async def test_async(self):
+        ''' under ASGI the chunks are made one by one in a thread '''
+
+        resp = await self.async_client.get('/sales', {'date': self.DATE_TIME_WITH_TZ})
+        self.assertTrue(resp.is_async)
+        content = b''.join([chunk async for chunk in resp.streaming_content])
+        self.assertEqual(json.loads(content)['items'][0]['id'], self.offer_id)
+
+
+class NodesBatchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.items, cls.levels = generate_catalog(
+            size=200, depth=4, fanout=4, offer_ratio=0.2, seed=4
+        )
+
+    def setUp(self):
+        resp = self.client.post(
+            '/imports', content_type='application/json',
+            data={'updateDate': '2022-06-01T00:00:00.000Z', 'items': self.items}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def _get_node(self, node_id):
+        resp = self.client.get(f'/nodes/{node_id}')
+        return json.loads(b''.join(resp) if resp.streaming else resp.content)
+
+    def test_batch(self):
+        offer_id = next(i['id'] for i in self.items if i['type'] == ItemType.OFFER.value)
+        missing_id = 'f1111111-1111-1111-1111-111111111111'
+        # overlapping subtrees, a missing node and a repeated id
+        ids = [
+            self.levels[2][0], self.levels[1][0], self.levels[1][1], offer_id, missing_id,
+            self.levels[0][0], self.levels[1][0],
+        ]
+
+        with self.assertNumQueries(1):
+            resp = self.client.get('/nodes', {'ids': ','.join(ids)})
+        self.assertEqual(resp.status_code, 200)
+        subtrees = json.loads(resp.content)
+
+        self.assertEqual(list(subtrees), list(dict.fromkeys(ids)))
+        self.assertEqual(subtrees[missing_id], {'code': 404, 'message': 'Item not found'})
+        for node_id in ids:
+            if node_id != missing_id:
+                self.assertEqual(subtrees[node_id], self._get_node(node_id))
+
+    def test_bad_ids(self):
+        self.assertEqual(self.client.get('/nodes').status_code, 400)
+        self.assertEqual(self.client.get('/nodes', {'ids': 'x'}).status_code, 400)
+        ids = ','.join(self.levels[1][0] for __ in range(101))
+        self.assertEqual(self.client.get('/nodes', {'ids': ids}).status_code, 400)
+
+
+class SkipUnchangedTest(TestCase, TestCommonMixin):
+    root = TestCommonMixin._category('a2222222-2222-2222-2222-222222222221', name='root')
+    categories = [TestCommonMixin._category(
+        f'a2222222-2222-2222-2222-22222222223{i}', 'a2222222-2222-2222-2222-222222222221',
+        f'category {i}'
+    ) for i in range(2)]
+    offers = [TestCommonMixin._offer(
+        f'a2222222-2222-2222-2222-22222222224{i}', 100 * (i + 1),
+        f'a2222222-2222-2222-2222-22222222223{i}', f'offer {i}'
+    ) for i in range(2)]
+
+    def _get_dates(self):
+        return {
+            str(m.id): m.date.strftime('%d') for m in ImportModel.objects.all()
+        }
+
+    def _get_rows(self):
+        content = self.client.get('/metrics').content.decode()
+        rows = {'written': 0, 'skipped': 0}
+        for result, value in re.findall(
+            r'^prices_comparator_import_rows_total\{result="(\w+)"\} (\S+)$', content, re.M
+        ):
+            rows[result] = float(value)
+        return rows
+
+    def setUp(self):
+        self._post([self.root] + self.categories + self.offers, '2022-06-01T00:00:00.000Z')
+
+    def test_unchanged(self):
+        rows = self._get_rows()
+        self._post([self.root, self.offers[0]], '2022-06-02T00:00:00.000Z')
+
+        self.assertEqual(set(self._get_dates().values()), {'01'})
+        self.assertEqual(PriceHistoryModel.objects.count(), 5)
+        self.assertEqual(self._get_rows(), {
+            'written': rows['written'], 'skipped': rows['skipped'] + 3
+        })
+
+    def test_changed(self):
+        self._post([dict(self.offers[0], name='renamed')], '2022-06-02T00:00:00.000Z')
+        self.assertEqual(self._get_dates(), {
+            self.root['id']: '02', self.categories[0]['id']: '02', self.offers[0]['id']: '02',
+            self.categories[1]['id']: '01', self.offers[1]['id']: '01',
+        })
+        self.assertEqual(PriceHistoryModel.objects.count(), 8)
+
+    def test_moved(self):
+        self._post(
+            [dict(self.categories[1], parentId=self.categories[0]['id'])],
+            '2022-06-02T00:00:00.000Z'
+        )
+        dates = self._get_dates()
+        self.assertEqual(dates[self.offers[0]['id']], '01')
+        self.assertEqual(dates[self.offers[1]['id']], '01')
+        self.assertEqual(dates[self.categories[1]['id']], '02')
+        self.assertEqual(dates[self.categories[0]['id']], '02')
+        self.assertEqual(dates[self.root['id']], '02')
+
+        offer = ImportModel.objects.get(id=self.offers[1]['id'])
+        self.assertTrue(offer.path.startswith(f'/{self.root["id"]}/{self.categories[0]["id"]}/'))
+        call_command('reconcile_aggregates', stdout=io.StringIO())
+
+
+class ConcurrentImportsTest(TransactionTestCase, TestCommonMixin):
+    ''' imports and deletes of one tree are run by threads with their own connections '''
+
+    root_id = 'a3333333-3333-3333-3333-333333333330'
+    category_ids = ('a3333333-3333-3333-3333-333333333331', 'a3333333-3333-3333-3333-333333333332')
+    moved_id = 'a3333333-3333-3333-3333-333333333333'
+
+    def _post_in_thread(self, items):
+        ''' a client of the thread, the status is checked by the caller '''
+
+        return Client().post(
+            '/imports', content_type='application/json',
+            data={'updateDate': self.DATE_TIME_WITH_TZ, 'items': items}
+        ).status_code
+
+    def _moved_offer(self, number, price):
+        return self._offer(f'a3333333-3333-3333-3333-{number:012}', price, self.moved_id)
+
+    def _run(self, task):
+        try:
+            return task()
+        finally:
+            connections.close_all()
+
+    def test_concurrent_writes(self):
+        deleted = [self._moved_offer(1000 + i, i) for i in range(16)]
+        self.assertEqual(self._post_in_thread(
+            [self._category(self.root_id, name='root')]
+            + [self._category(category_id, self.root_id) for category_id in self.category_ids]
+            + [self._category(self.moved_id, self.category_ids[0])]
+            + deleted
+        ), 200)
+
+        tasks = [lambda i=i: self._post_in_thread([self._moved_offer(i, i * 10)]) for i in range(48)]
+        tasks += [
+            lambda i=i: self._post_in_thread([self._category(self.moved_id, self.category_ids[i % 2])])
+            for i in range(16)
+        ]
+        tasks += [
+            lambda offer=offer: Client().delete(f'/delete/{offer["id"]}').status_code
+            for offer in deleted
+        ]
+        with ThreadPoolExecutor(16) as executor:
+            statuses = list(executor.map(self._run, tasks))
+        self.assertEqual(set(statuses), {200})
+
+        moved = ImportModel.objects.get(id=self.moved_id)
+        self.assertEqual(moved.offers_count, 48)
+        self.assertEqual(moved.price_sum, sum(i * 10 for i in range(48)))
+        call_command('reconcile_aggregates', stdout=io.StringIO())
+
+
+class MovedPathsTest(TestCase, TestCommonMixin):
+    ids = [f'a4444444-4444-4444-4444-44444444444{i}' for i in range(4)]
+
+    def _chain_category(self, number, parent_number=None):
+        return self._category(
+            self.ids[number], None if parent_number is None else self.ids[parent_number]
+        )
+
+    def _get_path(self, number):
+        return ImportModel.objects.get(id=self.ids[number]).path
+
+    def test_moves(self):
+        # a chain 0 <- 1 <- 2 <- 3
+        self._post([self._chain_category(i, i - 1 if i else None) for i in range(4)])
+
+        # to an ancestor, the old path starts with the new parent path
+        self._post([self._chain_category(2, 0)])
+        self.assertEqual(self._get_path(2), f'/{self.ids[0]}/{self.ids[2]}/')
+        self.assertEqual(self._get_path(3), f'/{self.ids[0]}/{self.ids[2]}/{self.ids[3]}/')
+
+        # to the root
+        self._post([self._chain_category(2)])
+        self.assertEqual(self._get_path(2), f'/{self.ids[2]}/')
+        self.assertEqual(self._get_path(3), f'/{self.ids[2]}/{self.ids[3]}/')
+        call_command('reconcile_aggregates', stdout=io.StringIO())
+
+    def test_id_forms(self):
+        ''' the ids UUIDField takes in other forms are stored canonical '''
+
+        offer_id = 'a4444444-4444-4444-4444-444444444449'
+        offer = self._offer(offer_id, 10, self.ids[0])
+        self._post([self._chain_category(0), offer])
+
+        self._post([dict(
+            offer, id=offer_id.upper(), parentId='{' + self.ids[0].replace('-', '') + '}',
+            price=30
+        )])
+        self.assertEqual(ImportModel.objects.get(id=offer_id).path, f'/{self.ids[0]}/{offer_id}/')
+        resp = self.client.get(f'/nodes/{self.ids[0]}')
+        self.assertEqual(json.loads(resp.content)['price'], 30)
+        call_command('reconcile_aggregates', stdout=io.StringIO())
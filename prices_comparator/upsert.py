@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.db import connection
+
+from prices_comparator.models import ImportModel
+
+
+UPSERT_ENGINE_BULK = 'bulk'
+UPSERT_ENGINE_COPY = 'copy'
+
+UPDATE_FIELDS = (
+    'parent_id', 'name', 'price', 'date', 'offers_count', 'price_sum', 'path',
+    'version', 'modified'
+)
+
+
+def upsert_models(models, engine=None):
+    ''' the engine is taken from IMPORT_UPSERT_ENGINE setting by default '''
+
+    engine = engine or settings.IMPORT_UPSERT_ENGINE
+    if engine == UPSERT_ENGINE_COPY:
+        copy_upsert_models(models)
+    elif engine == UPSERT_ENGINE_BULK:
+        bulk_upsert_models(models)
+    else:
+        raise ValueError(f'Unknown upsert engine \'{engine}\'')
+
+
+def bulk_upsert_models(models):
+    ImportModel.objects.bulk_update_or_create(
+        models, UPDATE_FIELDS, match_field='id'
+    )
+
+
+class _RowsReader:
+    ''' file-like object giving COPY text rows of the models as psycopg2 reads them '''
+
+    _escapes = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+    def __init__(self, models, fields):
+        attnames = [f.attname for f in fields]
+        self._rows = (self._to_row(m, attnames) for m in models)
+        self._buf = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._buf += row
+
+        if size < 0:
+            size = len(self._buf)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    @classmethod
+    def _to_row(cls, model, attnames):
+        ''' str() of uuids, numbers and aware datetimes is understood by postgres as is '''
+
+        values = []
+        for attname in attnames:
+            value = getattr(model, attname)
+            values.append('\\N' if value is None else str(value).translate(cls._escapes))
+        return '\t'.join(values) + '\n'
+
+
+def copy_upsert_models(models):
+    ''' streams the models into a temporary table by COPY and applies them
+    with a single INSERT ... ON CONFLICT, must be called in a transaction '''
+
+    fields = [ImportModel._meta.get_field(f) for f in ('id', 'type') + UPDATE_FIELDS]
+    columns = ', '.join(f.column for f in fields)
+    updates = ', '.join(
+        f'{f.column} = EXCLUDED.{f.column}' for f in fields if f.name in UPDATE_FIELDS
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute('''CREATE TEMPORARY TABLE IF NOT EXISTS import_staging
+            (LIKE prices_comparator_importmodel INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+        ''')
+        cursor.execute('TRUNCATE import_staging')
+        cursor.copy_expert(
+            f'COPY import_staging ({columns}) FROM STDIN', _RowsReader(models, fields)
+        )
+        cursor.execute(f'''INSERT INTO prices_comparator_importmodel ({columns})
+            SELECT {columns} FROM import_staging
+            ON CONFLICT (id) DO UPDATE SET {updates}
+        ''')
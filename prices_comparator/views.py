@@ -1,18 +1,74 @@
-import math
+from django.conf import settings
 from django.views import View
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotFound
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, HttpResponseNotFound, StreamingHttpResponse
+)
 from django.forms import ValidationError
-from django.forms.models import model_to_dict
-from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, connection, connections, transaction
 
+from asgiref.sync import sync_to_async
+
+import bisect
+import itertools
 import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from json.decoder import JSONDecodeError
 
-from prices_comparator.import_forms import ImportForm, NodeForm
+from prices_comparator import async_db, json_stream, metrics
+from prices_comparator.import_forms import (
+    ImportValidator, NodeForm, NodePageForm, NodesBatchForm, NodeStatisticForm, SalesForm
+)
 from prices_comparator.models import ImportModel
+from prices_comparator.middleware import record_sql
+from prices_comparator.node_serializer import (
+    ID, NODE_COLUMNS, OFFERS_COUNT, PARENT_ID, PATH, NodeSerializer
+)
+from prices_comparator.nodes_cache import CachedNode, get_nodes_cache
+from prices_comparator.pooled_postgresql.pool import get_pools_stats
+from prices_comparator.price_history import ensure_partition, get_history, write_history
+from prices_comparator.upsert import upsert_models
+import prices_comparator.common as const
 from prices_comparator.common import ItemType
 
 
+def get_streaming_response(request, content):
+    ''' the ASGI handler reads a sync stream to the end before sending it,
+    there the chunks are made by an async iterator one by one in a thread '''
+
+    if isinstance(request, ASGIRequest):
+        content = _iter_in_thread(content)
+    return StreamingHttpResponse(content)
+
+
+async def _iter_in_thread(content):
+    ''' the thread is the stream's own, so its cursor stays on the db connection
+    of one thread, which is closed with the stream '''
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    next_chunk = sync_to_async(
+        lambda: next(content, None), thread_sensitive=False, executor=executor
+    )
+
+    def close():
+        try:
+            content.close()
+        finally:
+            connections.close_all()
+
+    try:
+        while (chunk := await next_chunk()) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(close, thread_sensitive=False, executor=executor)()
+        executor.shutdown(wait=False)
+
+
 class PricesComparatorView(View):
 
     _http_resp_bad_request = HttpResponseBadRequest(json.dumps({
@@ -25,69 +81,262 @@ class PricesComparatorView(View):
         'message': 'Item not found'
     }))
 
+    _subtree_sql = f'''SELECT {', '.join(NODE_COLUMNS)} FROM prices_comparator_importmodel
+        WHERE path ~>=~ %(path)s AND path ~<~ {ImportModel.PATH_END_FUNCTION}(%(path)s)
+        ORDER BY path USING ~<~
+    '''
+
     def post(self, request):
         try:
-            data = json.loads(request.body.decode())
-
-            import_form = ImportForm(data)
-            if not import_form.is_valid():
-                raise ValidationError(message='Validation error')
+            validator = ImportValidator()
+            # the items are validated as they're parsed
+            add_item = metrics.CallTimer(validator.add_item)
+            started = time.perf_counter()
+            try:
+                data = json_stream.load_object(
+                    request, {'items': add_item}, max_size=settings.IMPORT_MAX_BODY_SIZE
+                )
+            finally:
+                parsed = time.perf_counter()
+                metrics.observe_phase('imports', 'parse', parsed - started - add_item.seconds)
+
+            try:
+                update_date = validator.validate(data)
+            finally:
+                metrics.observe_phase(
+                    'imports', 'validate', add_item.seconds + time.perf_counter() - parsed
+                )
 
-            local_ids = getattr(import_form.fields.get('items', None), 'local_ids', {})
-            all_ids = getattr(import_form.fields.get('items', None), 'all_ids', {})
-            update_date = import_form.cleaned_data['updateDate']
+            local_ids = validator.local_ids
+            all_ids = validator.all_ids
+            metrics.IMPORT_BATCH_SIZE.observe(len(local_ids))
 
+            # out of the import transaction, creating it locks the whole history
+            ensure_partition(update_date)
             with transaction.atomic():
-                models = self._get_models_by_ids(all_ids)
-
-                while local_ids:
-                    __, item = local_ids.popitem()
-                    self._save_model_with_parents(item, local_ids, models, update_date)
-
-                for m in models.values():
-                    m.date = update_date
-
-                ImportModel.objects.bulk_update_or_create(
-                    models.values(), ('parent_id','name','price','date'),
-                    match_field='id'
-                )
-
-        except (JSONDecodeError, IntegrityError, ValidationError, KeyError) as ex:
+                with metrics.time_phase('imports', 'fetch_ancestors'):
+                    models = self._get_models_by_ids(all_ids)
+                old_paths = {id: m.path for id, m in models.items()}
+                old_states = {id: self._get_state(m) for id, m in models.items()}
+
+                with metrics.time_phase('imports', 'build'):
+                    for item in self._sort_topologically(local_ids, self._get_item_parent_id):
+                        self._save_model(item, models, update_date)
+
+                    updated_ids = self._get_updated_ids(models, old_states)
+                    for m in self._sort_topologically(models, self._get_model_parent_id):
+                        self._set_path(m, models)
+
+                if updated_ids:
+                    with metrics.time_phase('imports', 'version'):
+                        version, modified = self._get_next_version()
+                    for node_id in updated_ids:
+                        m = models[node_id]
+                        m.date = update_date
+                        m.version, m.modified = version, modified
+
+                with metrics.time_phase('imports', 'move_paths'):
+                    self._move_descendants_paths(old_paths, models)
+
+                # the nodes under moved ones change only the paths
+                written = [
+                    m for id, m in models.items()
+                    if id in updated_ids or m.path != old_paths.get(id, None)
+                ]
+                metrics.IMPORT_ROWS.labels(result='written').inc(len(written))
+                metrics.IMPORT_ROWS.labels(result='skipped').inc(len(models) - len(written))
+
+                if written:
+                    with metrics.time_phase('imports', 'upsert'):
+                        upsert_models(written)
+                if updated_ids:
+                    with metrics.time_phase('imports', 'history'):
+                        write_history(updated_ids, update_date)
+                self._invalidate_cache(updated_ids)
+
+        except (JSONDecodeError, UnicodeDecodeError, IntegrityError, ValidationError, KeyError) as ex:
             return self._http_resp_bad_request
 
         return HttpResponse()
 
     def get(self, request, *args, **kwargs):
-        return self._process_node(request.method, kwargs['id'])
+        return self._process_node(request, kwargs['id'])
 
     def delete(self, request, *args, **kwargs):
-        return self._process_node(request.method, kwargs['id'])
+        return self._process_node(request, kwargs['id'])
 
     def _get_models_by_ids(self, ids):
-        return {str(m.id): m for m in self._get_nodes_parents(ids)}
+        ''' the stored nodes and all their ancestors locked for update in path order,
+        so imports and deletes of a tree wait for each other from its root and
+        the aggregates and paths read stay valid till the commit; a node moved while
+        its lock was awaited has new ancestors, they're locked the next round;
+        the ids go as one array literal, but psycopg2 interpolates it into the
+        query text on the client, so a query grows with its ids, and the chunks
+        are what bounds its size for big imports '''
+
+        chunk_size = settings.IMPORT_ANCESTORS_CHUNK_SIZE
+        ids = list(ids)
+        paths = {}
+        for i in range(0, len(ids), chunk_size):
+            paths.update(self._get_nodes_parents_paths(ids[i:i + chunk_size]))
+
+        models = {}
+        ids = sorted(paths, key=paths.get)
+        requested = set(ids)
+        while ids:
+            for i in range(0, len(ids), chunk_size):
+                models.update(
+                    (str(m.id), m) for m in self._lock_nodes(ids[i:i + chunk_size])
+                )
+            ids = {id for m in models.values() for id in self._get_path_ids(m.path)}
+            ids = sorted(ids - requested)
+            requested.update(ids)
+        return models
+
+    @staticmethod
+    def _sort_topologically(nodes, get_parent_id):
+        ''' Kahn's algorithm over a dict id -> node, parents come before their children '''
+
+        children = {}
+        ordered_ids = []
+        for node_id, node in nodes.items():
+            parent_id = get_parent_id(node)
+            if parent_id in nodes:
+                children.setdefault(parent_id, []).append(node_id)
+            else:
+                ordered_ids.append(node_id)
+
+        # the list grows while it's iterated
+        for node_id in ordered_ids:
+            ordered_ids.extend(children.get(node_id, ()))
+
+        if len(ordered_ids) != len(nodes):
+            raise IntegrityError('There is a cycle in the parents')
+
+        return [nodes[node_id] for node_id in ordered_ids]
 
-    def _save_model_with_parents(self, item, ids, db_ids, update_date):
-        parent_model = self._get_parent_model(item, ids, db_ids, update_date)
-        model_type = getattr(db_ids[item['id']], 'type') if item['id'] in db_ids else None
+    @staticmethod
+    def _get_item_parent_id(item):
+        return item.get('parentId', None)
+
+    @staticmethod
+    def _get_model_parent_id(model):
+        return str(model.parent_id_id) if model.parent_id_id else None
+
+    @staticmethod
+    def _get_state(model):
+        ''' the fields an import can change, the date aside '''
+
+        return (
+            str(model.parent_id_id) if model.parent_id_id else None,
+            model.name, model.price, model.offers_count, model.price_sum
+        )
+
+    def _get_updated_ids(self, db_ids, old_states):
+        ''' the new nodes, the ones whose fields differ from the stored ones
+        and all their ancestors, the old ones of the moved nodes as well '''
+
+        updated_ids = {
+            id for id, m in db_ids.items() if self._get_state(m) != old_states.get(id, None)
+        }
+        for node_id in list(updated_ids):
+            old_state = old_states.get(node_id, None)
+            parent_ids = [self._get_model_parent_id(db_ids[node_id])]
+            if old_state:
+                parent_ids.append(old_state[0])
+
+            for parent_id in parent_ids:
+                # the ancestors of a marked node are marked by the time it's passed
+                while parent_id and parent_id not in updated_ids:
+                    updated_ids.add(parent_id)
+                    parent_id = self._get_model_parent_id(db_ids[parent_id])
+
+        return updated_ids
+
+    def _save_model(self, item, db_ids, update_date):
+        ''' the parent of the item has to be saved already '''
+
+        parent_model = db_ids.get(item.get('parentId', None), None)
+        old_model = db_ids.get(item['id'], None)
+        model_type = getattr(old_model, 'type', None)
         self._check_item_integrity(parent_model, item['type'], model_type)
 
         m = ImportModel(
             id=item['id'], name=item['name'], parent_id=parent_model,
             type=item['type'], price=item.get('price', None), date=update_date
         )
+        self._set_aggregates(m, old_model)
 
         db_ids[item['id']] = m
-        ids.pop(item['id'], None)
+        self._move_aggregates(old_model, m, db_ids)
 
         return m
 
-    def _get_parent_model(self, item, ids, db_ids, update_date):
-        parent_id = item.get('parentId', None)
-        if parent_id in ids:
-            return self._save_model_with_parents(
-                ids[parent_id], ids, db_ids, update_date
+    @staticmethod
+    def _set_aggregates(model, old_model):
+        if model.type == ItemType.OFFER.value:
+            model.offers_count, model.price_sum = 1, model.price
+        elif old_model:
+            model.offers_count = old_model.offers_count
+            model.price_sum = old_model.price_sum
+
+    def _move_aggregates(self, old_model, new_model, db_ids):
+        ''' takes the node subtree off the old ancestors and puts it on the new ones '''
+
+        if old_model:
+            self._add_aggregates(
+                old_model, db_ids, -old_model.offers_count, -old_model.price_sum
             )
-        return db_ids.get(parent_id, None)
+        self._add_aggregates(
+            new_model, db_ids, new_model.offers_count, new_model.price_sum
+        )
+
+    @staticmethod
+    def _add_aggregates(model, db_ids, offers_count, price_sum):
+        visited = {str(model.id)}
+        parent_id = model.parent_id_id
+        while parent_id:
+            parent_id = str(parent_id)
+            if parent_id in visited:
+                raise IntegrityError('Node can\'t be a parent of its ancestor')
+            visited.add(parent_id)
+
+            parent = db_ids[parent_id]
+            parent.offers_count += offers_count
+            parent.price_sum += price_sum
+            parent_id = parent.parent_id_id
+
+    @staticmethod
+    def _set_path(model, db_ids):
+        ''' the path of the parent has to be set already '''
+
+        parent = db_ids.get(str(model.parent_id_id), None) if model.parent_id_id else None
+        model.path = f'{parent.path if parent else "/"}{model.id}/'
+
+    @staticmethod
+    def _move_descendants_paths(old_paths, db_ids):
+        ''' replaces the prefix of the nearest moved ancestor in the paths of the stored nodes '''
+
+        moved = [
+            (old_path, db_ids[id].path) for id, old_path in old_paths.items()
+            if old_path != db_ids[id].path
+        ]
+        if not moved:
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'''UPDATE prices_comparator_importmodel AS m
+                SET path = mv.new_path || substr(m.path, length(mv.old_path) + 1)
+                FROM (
+                    SELECT DISTINCT ON (d.id) d.id, p.old_path, p.new_path
+                    FROM unnest(%s::text[], %s::text[]) AS p(old_path, new_path)
+                    JOIN prices_comparator_importmodel AS d
+                        ON d.path ~>=~ p.old_path
+                        AND d.path ~<~ {ImportModel.PATH_END_FUNCTION}(p.old_path)
+                    ORDER BY d.id, length(p.old_path) DESC
+                ) AS mv
+                WHERE m.id = mv.id
+            ''', [[p[0] for p in moved], [p[1] for p in moved]])
 
     @staticmethod
     def _check_item_integrity(parent_model, item_type, model_type):
@@ -96,16 +345,18 @@ class PricesComparatorView(View):
         if model_type and item_type != model_type:
             raise IntegrityError('You can\'t change item type')
 
-    def _process_node(self, request_method, node_id):
+    def _process_node(self, request, node_id):
         try:
             node_id = self._get_node_id(node_id)
+            if request.method == 'DELETE':
+                delete_date = timezone.now()
+                ensure_partition(delete_date)
 
             with transaction.atomic():
-                if request_method == 'GET':
-                    resp_content = self._get_node_json(node_id)
-                    return HttpResponse(resp_content)
-                elif request_method == 'DELETE':
-                    self._delete_node(node_id)
+                if request.method in ('GET', 'HEAD'):
+                    return self._get_node_response(request, node_id)
+                elif request.method == 'DELETE':
+                    self._delete_node(node_id, delete_date)
                     return HttpResponse()
 
         except ValidationError:
@@ -122,116 +373,529 @@ class PricesComparatorView(View):
 
         return node_form.cleaned_data['id']
 
-    def _get_node_json(self, node_id):
-        children = self._get_node_children(node_id)
-        item = self._get_items(children, str(node_id))
-        if item:
-            return json.dumps(item)
-        else:
-            raise ImportModel.DoesNotExist
-
-    def _get_nodes_parents(self, ids):
-        return ImportModel.objects.raw(f'''WITH RECURSIVE node(id, parent_id_id, "type") AS (
-                SELECT id, parent_id_id, "type", "name" FROM prices_comparator_importmodel
-                WHERE id IN ({', '.join([f"'{str(i)}'" for i in ids])})
-            UNION ALL
-                SELECT ch.id, ch.parent_id_id, "ch"."type", "ch"."name" FROM prices_comparator_importmodel AS ch, node AS n
-                WHERE n.parent_id_id = ch.id)
-            SELECT DISTINCT * FROM node AS n
-        ''')
-
-    def _get_node_children(self, node_id):
-        return ImportModel.objects.raw(f'''WITH RECURSIVE node(id, parent_id_id, type) AS (
-                SELECT id, parent_id_id, type FROM prices_comparator_importmodel
-                WHERE id='{node_id}'
-            UNION ALL
-                SELECT ch.id, ch.parent_id_id, ch.type
-                FROM prices_comparator_importmodel AS ch, node AS n
-                WHERE n.id = ch.parent_id_id)
-            SELECT * FROM node AS n1 WHERE n1.id NOT IN (
-                SELECT DISTINCT n2.parent_id_id
-                FROM node AS n2 WHERE parent_id_id IS NOT NULL)
-        ''')
-
-    def _get_items(self, children, node_id):
-        node_item = self._get_node_item(children, node_id)
-
-        if node_item and node_item['type'] == ItemType.CATEGORY.value:
-            self._calc_categories_prices(node_item)
-
-        return node_item
-
-    def _get_node_item(self, children, node_id):
-        items_map = {}
-
-        if len(children) == 1 and not children[0].parent_id:
-            return self._model_to_dict(children[0])
-
-        for child in children:
-            child_dict = self._model_to_dict(child)
-            parent = child.parent_id
-
-            parent_dict = None
-            while parent:
-                try:
-                    parent_dict = items_map[str(parent.id)]
-                except KeyError:
-                    parent_dict = self._model_to_dict(parent)
-                    parent_dict['children'] = [child_dict]
-                    items_map[parent_dict['id']] = parent_dict
-                else:
-                    parent_dict['children'].append(child_dict)
-                    break
+    def _get_node_response(self, request, node_id):
+        ''' unchanged subtrees are answered with 304 by the node version,
+        big subtrees are streamed, their category prices are known in advance,
+        the other responses are cached for the version '''
 
-                child_dict = parent_dict
-                parent = parent.parent_id
+        page = self._get_page_params(request)
+        node = ImportModel.objects.get(id=node_id)
+        etag = quote_etag(str(node.version))
+        last_modified = int(node.modified.timestamp())
 
-        return items_map.get(node_id, None)
+        if page is not None:
+            return self._get_conditional_response(
+                request, etag, last_modified,
+                lambda: HttpResponse(self._get_node_page_json(node, **page))
+            )
 
-    def _calc_categories_prices(self, node_item):
-        price = 0
-        offers_count = 0
+        if node.offers_count >= settings.NODES_STREAMING_MIN_OFFERS:
+            return self._get_conditional_response(
+                request, etag, last_modified,
+                lambda: get_streaming_response(request, self._iter_node_json(node))
+            )
 
-        for child in node_item['children']:
-            if child['type'] == ItemType.OFFER.value:
-                offers_count += 1
-                price += child['price']
-            if child['type'] == ItemType.CATEGORY.value:
-                cat_offers_count, cat_price_sum = self._calc_categories_prices(child)
-                price += cat_price_sum
-                offers_count += cat_offers_count
+        def get_response():
+            cache = get_nodes_cache()
+            if cache:
+                # a cached response is read instead of the subtree
+                with metrics.time_phase('nodes', 'read'):
+                    cached = cache.get(node_id, etag)
+                if cached is not None:
+                    return HttpResponse(cached.content)
 
-        if offers_count:
-            node_item['price'] = math.floor(price / offers_count)
+            content = self._get_node_json(node)
+            if cache:
+                cache.set(node_id, CachedNode(content, etag, last_modified))
+            return HttpResponse(content)
 
-        return offers_count, price
+        return self._get_conditional_response(request, etag, last_modified, get_response)
 
     @staticmethod
-    def _model_to_dict(model):
-        ''' some fields are converted to strings to become jsonable '''
+    def _get_page_params(request):
+        ''' None when the whole subtree is asked '''
+
+        if not any(param in request.GET for param in ('depth', 'limit', 'after')):
+            return None
+
+        page_form = NodePageForm(request.GET)
+        if not page_form.is_valid():
+            raise ValidationError(message='Validation error')
+
+        return page_form.cleaned_data
 
-        d = model_to_dict(model)
+    @staticmethod
+    def _get_conditional_response(request, etag, last_modified, get_response):
+        ''' the response is built only if the client hasn't got it already;
+        Last-Modified has a resolution of a second, so changes made in the second
+        the response was built in would be missed by If-Modified-Since, it's
+        ignored as the version is always known by ETag '''
 
-        d['id'] = str(d['id'])
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = get_response()
+        return PricesComparatorView._set_validators(response, etag, last_modified)
 
-        parent_id = d.pop('parent_id')
-        d['parentId'] = str(parent_id) if parent_id else None
+    @staticmethod
+    def _set_validators(response, etag, last_modified):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
 
-        d['date'] = d['date'].isoformat(timespec='milliseconds')
-        d['date'] = d['date'].replace('+00:00', 'Z')
+    @staticmethod
+    def _invalidate_cache(node_ids):
+        ''' cached responses are dropped once the changes are committed '''
+
+        cache = get_nodes_cache()
+        if cache:
+            node_ids = list(node_ids)
+            transaction.on_commit(lambda: cache.invalidate(node_ids))
+
+    def _get_node_json(self, node):
+        with metrics.time_phase('nodes', 'read'):
+            rows = self._get_node_children(node.path)
+        metrics.SUBTREE_SIZE.observe(len(rows))
+        if not rows:
+            raise ImportModel.DoesNotExist
 
-        if d['type'] == ItemType.OFFER.value:
-            d['children'] = None
-        elif d['type'] == ItemType.CATEGORY.value:
-            d['children'] = []
-            d['price'] = None
+        with metrics.time_phase('nodes', 'serialize'):
+            return ''.join(NodeSerializer().iter_subtree(rows))
+
+    def _iter_node_json(self, node):
+        ''' emits the subtree as it's read from a server-side cursor,
+        the node goes first as it is already read; the stream is read after
+        the view returns, out of its transaction, and a cursor opened in
+        autocommit is WITH HOLD, which postgres materializes as a whole
+        before the first row, so the cursor has a transaction of its own '''
+
+        node_id = str(node.id)
+        node_row = tuple(getattr(node, column) for column in NODE_COLUMNS)
+
+        with transaction.atomic(), connection.chunked_cursor() as cursor:
+            cursor.execute(self._subtree_sql, {'path': node.path})
+            rows_timer = metrics.RowsTimer(cursor)
+            rows = (row for row in rows_timer if str(row[ID]) != node_id)
+            try:
+                yield from metrics.iter_timed_chunks(
+                    NodeSerializer().iter_subtree(itertools.chain([node_row], rows)),
+                    'nodes', rows_timer
+                )
+            finally:
+                record_sql(rows_timer.read_seconds, rows_timer.count, queries=0)
+
+    def _get_node_page_json(self, node, depth, limit, after):
+        ''' the subtree is read level by level, a page of children of every category
+        of the level at once, so only the levels and the pages asked are touched;
+        categories get nextCursor, the id their next page starts after,
+        and the ones below depth get null children '''
+
+        started = time.perf_counter()
+        read_seconds, rows_count = 0.0, 1
+
+        serializer = NodeSerializer()
+        root = serializer.to_dict(tuple(getattr(node, column) for column in NODE_COLUMNS))
+        level = []
+        if node.type == ItemType.CATEGORY.value:
+            root['nextCursor'] = None
+            level.append(root)
+
+        level_depth = 0
+        while level and (depth is None or level_depth < depth):
+            categories = {item['id']: item for item in level}
+            level = []
+
+            read_started = time.perf_counter()
+            rows = self._get_children_page(categories, limit, after if not level_depth else None)
+            read_seconds += time.perf_counter() - read_started
+            rows_count += len(rows)
+
+            for row in rows:
+                parent = categories[str(row[PARENT_ID])]
+                if limit is not None and len(parent['children']) == limit:
+                    parent['nextCursor'] = parent['children'][-1]['id']
+                    continue
+
+                child = serializer.to_dict(row)
+                parent['children'].append(child)
+                if child['type'] == ItemType.CATEGORY.value:
+                    child['nextCursor'] = None
+                    level.append(child)
+            level_depth += 1
+
+        for item in level:
+            item['children'] = None
+
+        content = json.dumps(root)
+        metrics.observe_read(
+            'nodes', read_seconds, time.perf_counter() - started - read_seconds, rows_count
+        )
+        return content
 
-        return d
+    @staticmethod
+    def _get_children_page(parent_ids, limit, after):
+        ''' up to limit + 1 children of every parent in id order by (parent_id, id) index,
+        the extra one tells there is a next page '''
+
+        columns = ', '.join(f'c.{column}' for column in NODE_COLUMNS)
+        with connection.cursor() as cursor:
+            cursor.execute(f'''SELECT {columns}
+                FROM unnest(%(ids)s::uuid[]) WITH ORDINALITY AS p(id, n)
+                CROSS JOIN LATERAL (
+                    SELECT * FROM prices_comparator_importmodel
+                    WHERE parent_id_id = p.id AND (%(after)s::uuid IS NULL OR id > %(after)s::uuid)
+                    ORDER BY id LIMIT %(limit)s
+                ) AS c
+                ORDER BY p.n, c.id
+            ''', {
+                'ids': '{' + ','.join(parent_ids) + '}',
+                'after': str(after) if after else None,
+                'limit': limit + 1 if limit else None,
+            })
+            return cursor.fetchall()
 
+    @staticmethod
+    def _get_nodes_parents_paths(ids):
+        ''' ids and paths of the nodes and all their ancestors listed in the paths '''
+
+        ids_array = '{' + ','.join(str(uuid.UUID(str(i).strip())) for i in ids) + '}'
+        with connection.cursor() as cursor:
+            cursor.execute('''SELECT id, path FROM prices_comparator_importmodel
+                WHERE id IN (
+                    SELECT unnest(string_to_array(trim(BOTH '/' FROM path), '/'))::uuid
+                    FROM prices_comparator_importmodel WHERE id = ANY(%s::uuid[]))
+            ''', [ids_array])
+            return [(str(node_id), path) for node_id, path in cursor.fetchall()]
 
     @staticmethod
-    def _delete_node(node_id):
-        deleted_count, __ = ImportModel.objects.get(id=node_id).delete()
-        if not deleted_count:
+    def _lock_nodes(ids):
+        ''' the rows are locked in the order they're sorted, the ones deleted
+        while their locks were awaited are skipped '''
+
+        return ImportModel.objects.raw('''SELECT * FROM prices_comparator_importmodel
+            WHERE id = ANY(%s::uuid[])
+            ORDER BY path USING ~<~
+            FOR UPDATE
+        ''', ['{' + ','.join(ids) + '}'])
+
+    def _get_node_children(self, path):
+        ''' the subtree is a range of paths starting with the node path,
+        the rows are in NODE_COLUMNS order '''
+
+        with connection.cursor() as cursor:
+            cursor.execute(self._subtree_sql, {'path': path})
+            return cursor.fetchall()
+
+    def _delete_node(self, node_id, delete_date):
+        ''' the ancestors change their prices, their history gets the new ones
+        as of the date of the deletion '''
+
+        node = self._get_models_by_ids([node_id]).get(str(node_id), None)
+        if node is None:
+            raise ImportModel.DoesNotExist()
+
+        with metrics.time_phase('delete', 'update_ancestors'):
+            self._sub_ancestors_aggregates(node)
+        ancestor_ids = self._get_path_ids(node.path)[:-1]
+        if ancestor_ids:
+            with metrics.time_phase('delete', 'history'):
+                write_history(ancestor_ids, delete_date)
+
+        cache = get_nodes_cache()
+        with metrics.time_phase('delete', 'delete'):
+            deleted_ids = self._delete_subtree(node.path, returning_ids=bool(cache))
+        if not deleted_ids:
             raise ImportModel.DoesNotExist()
 
+        if cache:
+            self._invalidate_cache(set(self._get_path_ids(node.path)) | set(deleted_ids))
+
+    @staticmethod
+    def _get_next_version():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(%s), now()', [ImportModel.VERSION_SEQUENCE]
+            )
+            return cursor.fetchone()
+
+    @staticmethod
+    def _get_path_ids(path):
+        return path.strip('/').split('/')
+
+    @staticmethod
+    def _delete_subtree(path, returning_ids):
+        ''' one statement by the path range instead of collecting the descendants
+        for CASCADE, the self foreign key is satisfied as the whole subtree goes;
+        returns the deleted ids or just their number '''
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'''DELETE FROM prices_comparator_importmodel
+                WHERE path ~>=~ %(path)s AND path ~<~ {ImportModel.PATH_END_FUNCTION}(%(path)s)
+                {'RETURNING id' if returning_ids else ''}
+            ''', {'path': path})
+            if returning_ids:
+                return [str(row[0]) for row in cursor.fetchall()]
+            return cursor.rowcount
+
+    @staticmethod
+    def _sub_ancestors_aggregates(node):
+        ''' the ancestors get a new version as their subtrees change '''
+
+        with connection.cursor() as cursor:
+            cursor.execute('''UPDATE prices_comparator_importmodel
+                SET offers_count = offers_count - %(offers_count)s,
+                    price_sum = price_sum - %(price_sum)s,
+                    version = nextval(%(version_sequence)s), modified = now()
+                WHERE id = ANY(string_to_array(trim(BOTH '/' FROM %(path)s), '/')::uuid[])
+                    AND id <> %(id)s
+            ''', {
+                'id': node.id,
+                'path': node.path,
+                'version_sequence': ImportModel.VERSION_SEQUENCE,
+                'offers_count': node.offers_count,
+                'price_sum': node.price_sum
+            })
+
+
+class AsyncPricesComparatorView(PricesComparatorView):
+    ''' served by ASGI: GET /nodes reads by asyncpg in the event loop, so a process
+    serves many of them at once; the imports, deletes and pages of children
+    are written and read by the ORM, they run in the thread of the request
+    as sync views do '''
+
+    _async_node_sql = f'''SELECT {', '.join(NODE_COLUMNS)}, version, modified
+        FROM prices_comparator_importmodel WHERE id = $1
+    '''
+
+    _async_subtree_sql = f'''SELECT {', '.join(NODE_COLUMNS)} FROM prices_comparator_importmodel
+        WHERE path ~>=~ $1 AND path ~<~ {ImportModel.PATH_END_FUNCTION}($1)
+        ORDER BY path USING ~<~
+    '''
+
+    async def post(self, request):
+        return await sync_to_async(super().post)(request)
+
+    async def delete(self, request, *args, **kwargs):
+        return await sync_to_async(super().delete)(request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            node_id = self._get_node_id(kwargs['id'])
+            page = self._get_page_params(request)
+        except ValidationError:
+            return self._http_resp_bad_request
+
+        if page is not None:
+            return await sync_to_async(super().get)(request, *args, **kwargs)
+
+        async with async_db.acquire() as db:
+            node = await async_db.fetchrow(db, self._async_node_sql, node_id)
+            if node is None:
+                return self._http_resp_not_found
+
+            node_row = tuple(node)[:len(NODE_COLUMNS)]
+            etag = quote_etag(str(node['version']))
+            last_modified = int(node['modified'].timestamp())
+
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                if node_row[OFFERS_COUNT] >= settings.NODES_STREAMING_MIN_OFFERS:
+                    response = StreamingHttpResponse(self._aiter_node_json(node_row[PATH]))
+                else:
+                    try:
+                        response = HttpResponse(await self._aget_node_json(
+                            db, node_id, node_row[PATH], etag, last_modified
+                        ))
+                    except ImportModel.DoesNotExist:
+                        return self._http_resp_not_found
+        return self._set_validators(response, etag, last_modified)
+
+    async def _aget_node_json(self, db, node_id, path, etag, last_modified):
+        ''' the other responses are cached for the version, the cache backend may be
+        remote, so it's called in a thread '''
+
+        cache = get_nodes_cache()
+        if cache:
+            with metrics.time_phase('nodes', 'read'):
+                cached = await sync_to_async(cache.get, thread_sensitive=False)(node_id, etag)
+            if cached is not None:
+                return cached.content
+
+        with metrics.time_phase('nodes', 'read'):
+            rows = await async_db.fetch(db, self._async_subtree_sql, path)
+        metrics.SUBTREE_SIZE.observe(len(rows))
+        if not rows:
+            raise ImportModel.DoesNotExist
+
+        with metrics.time_phase('nodes', 'serialize'):
+            content = ''.join(NodeSerializer().iter_subtree(rows))
+        if cache:
+            await sync_to_async(cache.set, thread_sensitive=False)(
+                node_id, CachedNode(content, etag, last_modified)
+            )
+        return content
+
+    async def _aiter_node_json(self, path, batch_size=2000):
+        ''' the subtree is read by a cursor, which needs a transaction, and emitted
+        by a chunk for a batch of rows, the connection is held till the end '''
+
+        serializer = NodeSerializer()
+        read_seconds, serialize_seconds, rows_count = 0.0, 0.0, 0
+        try:
+            async with async_db.acquire() as db, db.transaction():
+                started = time.perf_counter()
+                cursor = await db.cursor(self._async_subtree_sql, path)
+                while True:
+                    rows = await cursor.fetch(batch_size)
+                    read_started = time.perf_counter()
+                    read_seconds += read_started - started
+                    rows_count += len(rows)
+                    if not rows:
+                        break
+
+                    chunk = ''.join(serializer.iter_subtree_part(rows))
+                    started = time.perf_counter()
+                    serialize_seconds += started - read_started
+                    yield chunk
+                    started = time.perf_counter()
+
+            yield serializer.close_subtree()
+        finally:
+            record_sql(read_seconds, rows_count)
+            metrics.observe_read('nodes', read_seconds, serialize_seconds, rows_count)
+
+
+class NodeStatisticView(View):
+    ''' states of the node after every import that changed it,
+    the prices of categories are the averages of that time '''
+
+    def get(self, request, *args, **kwargs):
+        statistic_form = NodeStatisticForm(request.GET)
+        if not statistic_form.is_valid():
+            return PricesComparatorView._http_resp_bad_request
+
+        node_id = kwargs['id']
+        if not ImportModel.objects.filter(id=node_id).exists():
+            return PricesComparatorView._http_resp_not_found
+
+        with metrics.time_phase('statistic', 'read'):
+            rows = get_history(
+                node_id, statistic_form.cleaned_data['dateStart'],
+                statistic_form.cleaned_data['dateEnd']
+            )
+
+        return HttpResponse(''.join(NodeSerializer().iter_units(rows)))
+
+
+class NodesBatchView(View):
+    ''' GET /nodes?ids=<id>,<id> gives the subtrees of the nodes by ids in one query,
+    a subtree inside another requested one is read once, missing nodes get
+    the not found error instead of the subtree '''
+
+    # requested nodes which aren't in the subtrees of other requested ones
+    # are the roots of the ranges of paths read
+    _batch_sql = f'''WITH requested AS (
+            SELECT path FROM prices_comparator_importmodel WHERE id = ANY(%(ids)s::uuid[])
+        ), root AS (
+            SELECT r.path FROM requested AS r
+            WHERE NOT EXISTS (
+                SELECT 1 FROM requested AS a
+                WHERE a.path <> r.path
+                    AND r.path ~>=~ a.path AND r.path ~<~ {ImportModel.PATH_END_FUNCTION}(a.path)
+            )
+        )
+        SELECT {', '.join(f'm.{column}' for column in NODE_COLUMNS)}
+        FROM root JOIN prices_comparator_importmodel AS m
+            ON m.path ~>=~ root.path AND m.path ~<~ {ImportModel.PATH_END_FUNCTION}(root.path)
+        ORDER BY m.path USING ~<~
+    '''
+
+    _not_found = json.dumps({'code': 404, 'message': 'Item not found'})
+
+    def get(self, request):
+        batch_form = NodesBatchForm(request.GET)
+        if not batch_form.is_valid():
+            return PricesComparatorView._http_resp_bad_request
+
+        ids = batch_form.cleaned_data['ids']
+        with metrics.time_phase('nodes_batch', 'read'):
+            with connection.cursor() as cursor:
+                cursor.execute(self._batch_sql, {'ids': '{' + ','.join(ids) + '}'})
+                rows = cursor.fetchall()
+        metrics.SUBTREE_SIZE.observe(len(rows))
+
+        with metrics.time_phase('nodes_batch', 'serialize'):
+            return HttpResponse(self._dumps_subtrees(ids, rows))
+
+    def _dumps_subtrees(self, ids, rows):
+        ''' the rows are in path order, so a subtree is the range of the rows
+        from its root to the first path out of the root path '''
+
+        paths = [row[PATH] for row in rows]
+        starts = {str(row[ID]): i for i, row in enumerate(rows)}
+        serializer = NodeSerializer()
+
+        parts = []
+        for node_id in ids:
+            start = starts.get(node_id, None)
+            if start is None:
+                subtree = self._not_found
+            else:
+                root_path = paths[start]
+                end = bisect.bisect_left(paths, root_path[:-1] + '0', start)
+                subtree = ''.join(serializer.iter_subtree(rows[start:end]))
+            parts.append(f'"{node_id}": {subtree}')
+        return '{' + ', '.join(parts) + '}'
+
+
+class SalesView(View):
+    ''' offers updated in SALES_PERIOD up to the date inclusive, they're read
+    from a server-side cursor over the partial index of offers by date '''
+
+    _sales_sql = '''SELECT id, name, date, parent_id_id, %(type)s, price, NULL, NULL, NULL
+        FROM prices_comparator_importmodel
+        WHERE type = %(type)s AND date >= %(date_start)s AND date <= %(date_end)s
+        ORDER BY date
+    '''
+
+    def get(self, request):
+        sales_form = SalesForm(request.GET)
+        if not sales_form.is_valid():
+            return PricesComparatorView._http_resp_bad_request
+
+        date = sales_form.cleaned_data['date']
+        return get_streaming_response(
+            request, self._iter_sales_json(date - const.SALES_PERIOD, date)
+        )
+
+    def _iter_sales_json(self, date_start, date_end):
+        ''' the cursor has a transaction of its own, as the one of _iter_node_json,
+        out of it the cursor would be WITH HOLD and materialized as a whole '''
+
+        with transaction.atomic(), connection.chunked_cursor() as cursor:
+            cursor.execute(self._sales_sql, {
+                'type': ItemType.OFFER.value, 'date_start': date_start, 'date_end': date_end
+            })
+            rows_timer = metrics.RowsTimer(cursor)
+            try:
+                yield from NodeSerializer().iter_units(rows_timer)
+            finally:
+                record_sql(rows_timer.read_seconds, rows_timer.count, queries=0)
+
+
+class NodesCacheStatsView(View):
+    def get(self, request):
+        cache = get_nodes_cache()
+        stats = cache.stats() if cache else {'backend': None}
+        return HttpResponse(json.dumps(stats))
+
+
+class DbPoolStatsView(View):
+    def get(self, request):
+        return HttpResponse(json.dumps(get_pools_stats()))
+
+
+class MetricsView(View):
+    def get(self, request):
+        return HttpResponse(
+            metrics.render_metrics(), content_type=metrics.CONTENT_TYPE
+        )
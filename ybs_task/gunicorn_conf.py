@@ -0,0 +1,59 @@
+"""
+gunicorn settings for ybs_task project, run it by
+
+    gunicorn -c python:ybs_task.gunicorn_conf
+
+All the settings can be changed by environment variables.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:80')
+
+# 'ybs_task.asgi:application' with WEB_WORKER_CLASS='uvicorn_worker.UvicornWorker'
+# serves the API by async views
+wsgi_app = os.environ.get('WEB_APP', 'ybs_task.wsgi:application')
+
+# 'gthread' serves requests of a worker by WEB_THREADS threads
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+
+# the requests spend most of the time in python, so a worker per core,
+# the threads cover waiting for the db
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# seconds to keep an idle client connection open, put it above the balancer's one
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# a worker silent for this number of seconds is killed and restarted,
+# it has to fit the longest import
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+
+# on SIGHUP or SIGTERM workers finish their requests during this number of seconds
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+
+# a worker is restarted after this number of requests (with a jitter), 0 never restarts it
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', None)
+
+
+# the workers write the metrics to files of this directory, so /metrics of any of them
+# reports the sums of all, it is emptied on start to drop the files of the previous run
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'ybs_task_metrics')
+)
+
+
+def on_starting(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
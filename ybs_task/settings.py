@@ -19,34 +19,106 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-22y-!%9j4dj)pxq!%r59j3pwg)!v(e%*3ms=^_w_sn^_n98x(n'
 
-# Don't close connection to the db, sec
-CONN_MAX_AGE = 60
-
 ALLOWED_HOSTS = ['*']
 
 INSTALLED_APPS = [
     'prices_comparator'
 ]
 
-MIDDLEWARE = []
+MIDDLEWARE = [
+    'prices_comparator.middleware.MetricsMiddleware',
+    'prices_comparator.middleware.ProfilingMiddleware',
+]
 
 ROOT_URLCONF = 'ybs_task.urls'
 
 WSGI_APPLICATION = 'ybs_task.wsgi.application'
 
+ASGI_APPLICATION = 'ybs_task.asgi.application'
+
+# the API is served by async views, ybs_task/asgi.py turns it on
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
+# the max size of the asyncpg pool of an event loop the async views read by,
+# 0 connects for every request
+ASYNC_DB_POOL_MAX_SIZE = int(os.environ.get('ASYNC_DB_POOL_MAX_SIZE', 10))
+
+# a worker process keeps up to this number of connections to the db in a pool,
+# 0 turns the pool off
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'prices_comparator.pooled_postgresql',
         'NAME': os.environ.get('POSTGRES_DB'),
         'USER': os.environ.get('POSTGRES_USER'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
-        'PORT': 5432
+        'PORT': 5432,
+        # pooled connections are returned to the pool after every request,
+        # otherwise they are kept open for this number of seconds
+        'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else 60,
+        'POOL': {
+            'MAX_SIZE': DB_POOL_MAX_SIZE,
+            # idle connections above this number are closed after MAX_IDLE seconds
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'MAX_IDLE': int(os.environ.get('DB_POOL_MAX_IDLE', 600)),
+            # seconds to wait for a free connection before failing the request
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            # connections idle for this number of seconds are checked by SELECT 1
+            'CHECK_IDLE': int(os.environ.get('DB_POOL_CHECK_IDLE', 30)),
+        },
     }
 }
 
+# GET /nodes streams subtrees having at least this number of offers
+NODES_STREAMING_MIN_OFFERS = int(os.environ.get('NODES_STREAMING_MIN_OFFERS', 1000))
+
+# POST /imports bodies are read as a stream, so DATA_UPLOAD_MAX_MEMORY_SIZE doesn't apply,
+# longer ones are rejected by this limit in bytes
+IMPORT_MAX_BODY_SIZE = int(os.environ.get('IMPORT_MAX_BODY_SIZE', 64 * 1024 * 1024))
+
+# POST /imports fetches stored nodes and their ancestors by chunks of this number of ids
+IMPORT_ANCESTORS_CHUNK_SIZE = int(os.environ.get('IMPORT_ANCESTORS_CHUNK_SIZE', 10000))
+
+# POST /imports writes nodes with 'bulk' (django-bulk-update-or-create)
+# or 'copy' (COPY to a staging table and INSERT ... ON CONFLICT)
+IMPORT_UPSERT_ENGINE = os.environ.get('IMPORT_UPSERT_ENGINE', 'bulk')
+
+# GET /nodes responses are cached in an in-process LRU of this size in bytes,
+# 0 disables it; entries are checked by the node version, so it suits several processes
+NODES_CACHE_MAX_BYTES = int(os.environ.get('NODES_CACHE_MAX_BYTES', 0))
+
+# several processes have to share a cache, e.g. redis://127.0.0.1:6379/0
+NODES_CACHE_REDIS_URL = os.environ.get('NODES_CACHE_REDIS_URL', None)
+NODES_CACHE_ALIAS = 'nodes' if NODES_CACHE_REDIS_URL else None
+# seconds the entries of the shared cache live, the ones of outdated versions expire
+NODES_CACHE_TIMEOUT = int(os.environ.get('NODES_CACHE_TIMEOUT', 3600))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+if NODES_CACHE_REDIS_URL:
+    CACHES['nodes'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': NODES_CACHE_REDIS_URL,
+        'TIMEOUT': NODES_CACHE_TIMEOUT,
+    }
+
+# requests are profiled to this directory, the profiling is off without it
+PROFILING_DIR = os.environ.get('PROFILING_DIR', None)
+
+# this part of the requests is run under cProfile, the ones slower than
+# PROFILING_SLOW_MS milliseconds or having X-Profile header are dumped
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.01))
+PROFILING_SLOW_MS = int(os.environ.get('PROFILING_SLOW_MS', 500))
+
 TIME_ZONE = 'UTC'
 
 USE_TZ = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+TEST_RUNNER = 'ybs_task.test_runner.TestRunner'
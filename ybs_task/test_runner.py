@@ -0,0 +1,25 @@
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    ''' the tests are run with the defaults of the settings changing the responses,
+    so they don't depend on the environment of the deployment they're run in;
+    the tests of these features override them '''
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._defaults = override_settings(
+            NODES_CACHE_MAX_BYTES=0,
+            NODES_CACHE_ALIAS=None,
+            NODES_STREAMING_MIN_OFFERS=1000,
+            IMPORT_MAX_BODY_SIZE=64 * 1024 * 1024,
+            PROFILING_DIR=None,
+            # every async test runs in a loop of its own, a pool would outlive it
+            ASYNC_DB_POOL_MAX_SIZE=0,
+        )
+        self._defaults.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._defaults.disable()
+        super().teardown_test_environment(**kwargs)
@@ -14,13 +14,29 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
 from django.urls import path
 
-from prices_comparator.views import PricesComparatorView
+from prices_comparator.views import (
+    AsyncPricesComparatorView, DbPoolStatsView, MetricsView, NodesBatchView,
+    NodesCacheStatsView, NodeStatisticView, PricesComparatorView, SalesView
+)
 
 
-urlpatterns = [
-    path('imports', PricesComparatorView.as_view(), name='imports'),
-    path('nodes/<uuid:id>', PricesComparatorView.as_view(), name='nodes'),
-    path('delete/<uuid:id>', PricesComparatorView.as_view(), name='nodes'),
-]
+def get_urlpatterns(prices_view):
+    return [
+        path('imports', prices_view.as_view(), name='imports'),
+        path('nodes/<uuid:id>', prices_view.as_view(), name='nodes'),
+        path('nodes', NodesBatchView.as_view(), name='nodes_batch'),
+        path('delete/<uuid:id>', prices_view.as_view(), name='nodes'),
+        path('node/<uuid:id>/statistic', NodeStatisticView.as_view(), name='statistic'),
+        path('sales', SalesView.as_view(), name='sales'),
+        path('stats/cache', NodesCacheStatsView.as_view(), name='cache_stats'),
+        path('stats/db', DbPoolStatsView.as_view(), name='db_stats'),
+        path('metrics', MetricsView.as_view(), name='metrics'),
+    ]
+
+
+urlpatterns = get_urlpatterns(
+    AsyncPricesComparatorView if settings.ASYNC_VIEWS else PricesComparatorView
+)